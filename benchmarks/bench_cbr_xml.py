@@ -0,0 +1,104 @@
+import argparse
+import gc
+import json
+import time
+from datetime import date, datetime, timedelta
+from xml.dom import minidom
+
+from ibtax.currencies import parse_rates
+from ibtax.transport import CHUNK_SIZE
+
+
+def make_response(years):
+    # XML_dynamic.asp response with a record per working day
+    end = date(2021, 12, 31)
+    start = end - timedelta(days=365 * years)
+
+    parts = [
+        '<?xml version="1.0" encoding="windows-1251"?>'
+        '<ValCurs ID="R01235" DateRange1="{:%d.%m.%Y}"'
+        ' DateRange2="{:%d.%m.%Y}" name="Foreign Currency Market Dynamic">'
+        "".format(start, end)
+    ]
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            value = "{:.4f}".format(60 + day.toordinal() % 97 / 10)
+            parts.append(
+                '<Record Date="{:%d.%m.%Y}" Id="R01235">'
+                "<Nominal>1</Nominal><Value>{}</Value></Record>".format(
+                    day, value.replace(".", ",")
+                )
+            )
+        day += timedelta(days=1)
+    parts.append("</ValCurs>")
+
+    return "".join(parts).encode("cp1251")
+
+
+def parse_minidom(contents):
+    # the former DOM based loader
+    dom = minidom.parseString(contents)
+    root = dom.getElementsByTagName("ValCurs")[0]
+
+    def walk():
+        for node in root.getElementsByTagName("Record"):
+            value = node.getElementsByTagName("Value")[0].firstChild.nodeValue
+            value = float(value.replace(",", "."))
+
+            date_str = node.attributes["Date"].value
+            d = datetime.strptime(date_str, "%d.%m.%Y").date()
+            yield d.toordinal(), value
+
+    return list(walk())
+
+
+def parse_stream(contents):
+    def chunks():
+        for start in range(0, len(contents), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            yield contents[start:end]
+
+    return [x for batch in parse_rates(chunks()) for x in batch]
+
+
+def timed(fn, contents, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        records = fn(contents)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return records, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    contents = make_response(args.years)
+
+    expected, dom_seconds = timed(parse_minidom, contents, args.repeat)
+    records, stream_seconds = timed(parse_stream, contents, args.repeat)
+    assert records == expected
+
+    print(
+        json.dumps(
+            dict(
+                benchmark="cbr_xml",
+                years=args.years,
+                records=len(records),
+                bytes=len(contents),
+                minidom_seconds=round(dom_seconds, 6),
+                expat_seconds=round(stream_seconds, 6),
+                speedup=round(dom_seconds / stream_seconds, 2),
+            )
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import gc
+import json
+import time
+from datetime import datetime, timedelta
+
+from ibtax.equities import SymbolTrades, Trade, take_profits
+
+
+def make_trades(fills):
+    # two buys of 4 then sells of 5 and 3, every sell splits a lot
+    pattern = (4, 4, -5, -3)
+    start = datetime(2000, 1, 1)
+
+    def walk():
+        for i in range(fills):
+            quantity = pattern[i % len(pattern)]
+            yield Trade(
+                asset_category="Stocks",
+                currency="USD",
+                symbol="BENCH",
+                datetime=start + timedelta(seconds=i),
+                quantity=quantity,
+                t_price=100.5,
+                comm_fee=-0.35,
+                realized_pl=1.5 if quantity < 0 else 0.0,
+                code="O",
+            )
+
+    return SymbolTrades("BENCH", list(walk()))
+
+
+def bench(fills):
+    symb = make_trades(fills)
+    # same as timeit, the collector pauses would hide the matching cost
+    gc.collect()
+    gc.disable()
+
+    started = time.perf_counter()
+    profits = take_profits(symb)
+    elapsed = time.perf_counter() - started
+    gc.enable()
+
+    return dict(
+        benchmark="take_profits",
+        fills=fills,
+        take_profits=len(profits),
+        seconds=round(elapsed, 6),
+        us_per_fill=round(elapsed / fills * 1e6, 3),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fills",
+        type=int,
+        nargs="+",
+        default=[10**3, 10**4, 10**5, 10**6],
+    )
+    args = parser.parse_args()
+
+    for fills in args.fills:
+        print(json.dumps(bench(fills)))
+
+
+if __name__ == "__main__":
+    main()
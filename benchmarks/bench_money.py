@@ -0,0 +1,102 @@
+import argparse
+import gc
+import json
+import random
+import time
+
+from ibtax import money, vector
+from ibtax.formatting import to_f, to_k
+
+
+def make_items(size):
+    # dividend like amounts with cents and CBR like rates with 4 decimals
+    rnd = random.Random(0)
+    amounts = [rnd.randint(1, 10**6) / 100 for _ in range(size)]
+    paid = [round(x * 0.1, 2) for x in amounts]
+    rates = [rnd.randint(550000, 800000) / 10**4 for _ in range(size)]
+    return amounts, paid, rates
+
+
+TAX_RATE = 0.13
+
+
+def float_path(amounts, paid, rates):
+    # rub amounts as floats in plain python, as before ibtax.money
+    amounts_rub = [a * r for a, r in zip(amounts, rates)]
+    paid_rub = [p * r for p, r in zip(paid, rates)]
+    to_pay = [
+        max(0.0, TAX_RATE * a - p) for a, p in zip(amounts_rub, paid_rub)
+    ]
+    return [
+        (to_f(a), to_f(p), to_f(t))
+        for a, p, t in zip(amounts_rub, paid_rub, to_pay)
+    ]
+
+
+def money_path(amounts, paid, rates):
+    # as dividends.convert() and format_row()
+    rate_units = money.to_rate_units(rates)
+    amounts_rub = money.convert_amounts(amounts, rate_units)
+    paid_rub = money.convert_amounts(paid, rate_units)
+    to_pay = money.to_pay(amounts_rub, paid_rub)
+    return [
+        (to_k(a), to_k(p), to_k(t))
+        for a, p, t in zip(amounts_rub, paid_rub, to_pay)
+    ]
+
+
+def timed(fn, *args):
+    gc.collect()
+    gc.disable()
+    started = time.perf_counter()
+    rows = fn(*args)
+    elapsed = time.perf_counter() - started
+    gc.enable()
+    return elapsed, rows
+
+
+def bench(size, repeat):
+    amounts, paid, rates = make_items(size)
+
+    results = {}
+    for name, fn in (("float", float_path), ("money", money_path)):
+        results[name], rows = min(
+            (timed(fn, amounts, paid, rates) for _ in range(repeat)),
+            key=lambda x: x[0],
+        )
+
+    return dict(
+        benchmark="money",
+        items=size,
+        numpy=vector.np is not None,
+        float_seconds=round(results["float"], 6),
+        money_seconds=round(results["money"], 6),
+        ratio=round(results["money"] / results["float"], 3),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--items",
+        type=int,
+        nargs="+",
+        default=[10**3, 10**4, 10**5, 10**6],
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-numpy",
+        action="store_true",
+        help="time the money path in plain python",
+    )
+    args = parser.parse_args()
+
+    if args.no_numpy:
+        vector.np = None
+
+    for size in args.items:
+        print(json.dumps(bench(size, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import gen_statements
+
+import ibtax.main
+from ibtax import api, dividends, equities, vector
+from ibtax.cache import StatementCache
+from ibtax.currencies import CurrencyMap
+from ibtax.equities import Trade, group_trades, take_profits
+from ibtax.ratetable import open_currency_map, table_from_store
+from ibtax.render import write_years
+from ibtax.report import Report, cache_version
+from ibtax.store import RateStore
+
+RATES = dict(USD=60.0, CAD=45.0)
+
+
+def revision():
+    root = pathlib.Path(__file__).parent.parent
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def timed(fn, repeat):
+    # best of the runs, the collector is paused as in timeit
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def stub_rates(store, years):
+    # what the CBR would return, weekdays only
+    start = date(min(years) - 1, 12, 1)
+    end = date(max(years), 12, 31)
+    for currency, base in RATES.items():
+        records = []
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                value = base + day.toordinal() % 7 * 0.1234
+                records.append((day.toordinal(), value))
+            day += timedelta(days=1)
+        store.add(currency, start, end, records)
+
+
+def stub_map(store, years):
+    return CurrencyMap.build(
+        store,
+        date(min(years), 1, 1),
+        date(max(years), 12, 31),
+        currencies=RATES,
+        offline=True,
+    )
+
+
+def run_main(directory, paths):
+    # offline against the stubbed store, the output is thrown away
+    argv = sys.argv
+    sys.argv = ["ibtax", "--offline", "--no-cache", "--all-years"]
+    sys.argv += ["--year-report"] + [str(x) for x in paths]
+    ibtax.main.cache_dir = directory
+    try:
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                ibtax.main.main()
+    finally:
+        sys.argv = argv
+
+
+def suite(args, directory):
+    years = [int(x) for x in args.years.split(",")]
+    paths = gen_statements.write(
+        directory / "statements",
+        years,
+        symbols=args.symbols,
+        fills=args.fills,
+        dividends=args.dividends,
+        interest=args.interest,
+        lends=args.lends,
+        language=args.language,
+    )
+    size = sum(x.stat().st_size for x in paths)
+
+    store = RateStore(directory / ".rates.sqlite")
+    stub_rates(store, years)
+    currencies_map = stub_map(store, years)
+    table = table_from_store(store, directory / "rates.table")
+
+    def read():
+        return Report.read(paths[-1])
+
+    def load():
+        return Report.load(paths, workers=args.workers)
+
+    cache = StatementCache(directory / "cache", cache_version())
+    Report.load(paths, cache=cache)
+
+    def load_cached():
+        return Report.load(paths, cache=cache)
+
+    seconds, report = timed(load, args.repeat)
+    trades = report.records(Trade)
+    yield "report_load", seconds, dict(bytes=size, trades=len(trades))
+
+    seconds, _ = timed(read, args.repeat)
+    yield "report_read", seconds, dict(bytes=paths[-1].stat().st_size)
+
+    seconds, _ = timed(load_cached, args.repeat)
+    yield "report_load_cached", seconds, dict(bytes=size)
+
+    def profits():
+        return [
+            take_profit
+            for symb in group_trades(trades)
+            for take_profit in take_profits(symb)
+        ]
+
+    seconds, found = timed(profits, args.repeat)
+    yield "take_profits", seconds, dict(
+        trades=len(trades), take_profits=len(found)
+    )
+
+    seconds, events = timed(lambda: dividends.by_year(report), args.repeat)
+    yield "get_events", seconds, dict(
+        payouts=len(report.records(dividends.Payout)),
+        events=sum(len(x) for x in events.values()),
+    )
+
+    rnd = random.Random(0)
+    start = date(min(years), 1, 1).toordinal()
+    end = date(max(years), 12, 31).toordinal()
+    days = [date.fromordinal(rnd.randint(start, end)) for _ in range(10**5)]
+
+    def lookups():
+        get = currencies_map.get
+        for day in days:
+            get("USD", day)
+
+    seconds, _ = timed(lookups, args.repeat)
+    yield "currency_map_get", seconds, dict(lookups=len(days))
+
+    # what a worker pays before the first lookup
+    seconds, _ = timed(lambda: stub_map(store, years), args.repeat)
+    yield "currency_map_build", seconds, dict(currencies=len(RATES))
+
+    seconds, _ = timed(lambda: open_currency_map(table), args.repeat)
+    yield "currency_map_table", seconds, dict(currencies=len(RATES))
+    store.close()
+
+    # rub amounts and the tax of every section, then the csv of them
+    def compute():
+        return api.compute(report, currencies_map, years=report.years)
+
+    seconds, result = timed(compute, args.repeat)
+    yield "compute", seconds, dict(trades=len(trades))
+
+    seconds, _ = timed(lambda: write_years(io.StringIO(), result), args.repeat)
+    yield "render", seconds, dict(trades=len(trades))
+
+    # the same with and without numpy converting the sections
+    def compute_render():
+        write_years(io.StringIO(), compute())
+
+    np = vector.np
+    for use_numpy in (True, False) if np is not None else (False,):
+        vector.np = np if use_numpy else None
+        try:
+            seconds, _ = timed(compute_render, args.repeat)
+        finally:
+            vector.np = np
+        yield "compute_render", seconds, dict(
+            trades=len(trades), numpy=use_numpy
+        )
+
+    # the same equities straight to csv, per symbol on a pool with --workers
+    def equities_csv():
+        return equities.csv_by_year(
+            currencies_map, report, report.years, args.workers
+        )
+
+    seconds, _ = timed(equities_csv, args.repeat)
+    yield "equities_csv", seconds, dict(
+        trades=len(trades), workers=equities.pool_size(report, args.workers)
+    )
+
+    seconds, _ = timed(lambda: run_main(directory, paths), args.repeat)
+    yield "main", seconds, dict(bytes=size, trades=len(trades))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default="2019,2020")
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument(
+        "--fills", type=int, default=500, help="trades per symbol and year"
+    )
+    parser.add_argument("--dividends", type=int, default=4)
+    parser.add_argument(
+        "--interest", type=int, default=12, help="interest rows per year"
+    )
+    parser.add_argument(
+        "--lends", type=int, default=12, help="lend rows per year"
+    )
+    parser.add_argument("--language", choices=("en", "ru"), default="en")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--output", help="append the results to a json lines file"
+    )
+    args = parser.parse_args()
+
+    meta = dict(
+        revision=revision(),
+        python=platform.python_version(),
+        symbols=args.symbols,
+        fills=args.fills,
+        years=args.years,
+        language=args.language,
+    )
+
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for name, seconds, extra in suite(args, pathlib.Path(directory)):
+                result = dict(benchmark=name, seconds=round(seconds, 6))
+                result.update(extra)
+                result.update(meta)
+                print(json.dumps(result), file=out, flush=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import pathlib
+import random
+from datetime import date, datetime, timedelta
+
+LENDS_TITLE = (
+    "IBKR Managed Securities Lent Interest Details"
+    " (Stock Yield Enhancement Program)"
+)
+
+# the russian statements name the interest section in russian only
+INTEREST_SECTIONS = dict(
+    en=("Interest", ["Currency", "Date", "Description", "Amount"], "Total"),
+    ru=("Процент", ["Валюта", "Дата", "Описание", "Сумма"], "Всего"),
+)
+
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+
+def make_symbols(count, rnd):
+    # every fifth is listed in canada
+    symbols = []
+    for i in range(count):
+        currency = "CAD" if i % 5 == 4 else "USD"
+        symbols.append((f"S{i:04d}", currency, rnd.uniform(10, 500)))
+    return symbols
+
+
+def year_days(year, count, rnd):
+    start = date(year, 1, 2).toordinal()
+    end = date(year, 12, 28).toordinal()
+    return sorted(
+        date.fromordinal(rnd.randint(start, end)) for _ in range(count)
+    )
+
+
+class Holding:
+    # long only, realized P/L from the average price
+    def __init__(self, price):
+        self.price = price
+        self.quantity = 0
+        self.cost = 0.0
+
+    def fill(self, rnd):
+        self.price = max(1.0, self.price * rnd.uniform(0.97, 1.03))
+
+        if self.quantity == 0 or rnd.random() < 0.55:
+            quantity = rnd.randint(1, 100)
+            self.quantity += quantity
+            self.cost += quantity * self.price
+            return quantity, self.price, 0.0, "O"
+
+        quantity = rnd.randint(1, self.quantity)
+        avg = self.cost / self.quantity
+        self.quantity -= quantity
+        self.cost -= quantity * avg
+        realized = (self.price - avg) * quantity
+        code = "C" if self.quantity else "C;P"
+        return -quantity, self.price, realized, code
+
+
+def trade_rows(year, symbols, holdings, fills, rnd):
+    rows = [
+        [
+            "Trades",
+            "Header",
+            "DataDiscriminator",
+            "Asset Category",
+            "Currency",
+            "Symbol",
+            "Date/Time",
+            "Quantity",
+            "T. Price",
+            "C. Price",
+            "Proceeds",
+            "Comm/Fee",
+            "Basis",
+            "Realized P/L",
+            "MTM P/L",
+            "Code",
+        ]
+    ]
+
+    for symbol, currency, _ in symbols:
+        holding = holdings[symbol]
+        # fills of a day are in time order, as holding.fill() takes them
+        times = sorted(
+            datetime.combine(day, datetime.min.time())
+            + timedelta(seconds=rnd.randint(34200, 57600))
+            for day in year_days(year, fills, rnd)
+        )
+        for at in times:
+            quantity, price, realized, code = holding.fill(rnd)
+            proceeds = -quantity * price
+            rows.append(
+                [
+                    "Trades",
+                    "Data",
+                    "Order",
+                    "Stocks",
+                    currency,
+                    symbol,
+                    at.strftime("%Y-%m-%d, %H:%M:%S"),
+                    str(quantity),
+                    f"{price:.4f}",
+                    f"{price:.2f}",
+                    f"{proceeds:.2f}",
+                    "-1",
+                    f"{-proceeds:.2f}",
+                    f"{realized:.4f}",
+                    "0",
+                    code,
+                ]
+            )
+
+    rows.append(["Trades", "Total", "", "Stocks", "USD"] + [""] * 11)
+    return rows
+
+
+def dividend_rows(year, symbols, holdings, count, rnd):
+    payouts = [["Dividends", "Header", "Currency", "Date", "Description"]]
+    payouts[0].append("Amount")
+    withholds = [
+        [
+            "Withholding Tax",
+            "Header",
+            "Currency",
+            "Date",
+            "Description",
+            "Amount",
+            "Code",
+        ]
+    ]
+
+    for symbol, currency, _ in symbols:
+        shares = max(holdings[symbol].quantity, 10)
+        for month in range(count):
+            day = date(year, 1 + month * 12 // count, 15).isoformat()
+            per_share = round(rnd.uniform(0.05, 1.5), 2)
+            amount = round(per_share * shares, 2)
+            description = (
+                f"{symbol}(US0000000000) Cash Dividend {currency}"
+                f" {per_share} per Share (Ordinary Dividend)"
+            )
+            payouts.append(
+                ["Dividends", "Data", currency, day, description, amount]
+            )
+            withholds.append(
+                [
+                    "Withholding Tax",
+                    "Data",
+                    currency,
+                    day,
+                    description.replace("(Ordinary Dividend)", "- US Tax"),
+                    -round(amount * 0.1, 2),
+                    "",
+                ]
+            )
+
+    payouts.append(["Dividends", "Data", "Total", "", "", ""])
+    withholds.append(["Withholding Tax", "Data", "Total", "", "", "", ""])
+    return payouts + withholds
+
+
+def fee_rows(year, count):
+    rows = [
+        [
+            "Fees",
+            "Header",
+            "Subtitle",
+            "Currency",
+            "Date",
+            "Description",
+            "Amount",
+        ]
+    ]
+    for i in range(count):
+        day = date(year, 1 + i % 12, 3).isoformat()
+        rows.append(
+            ["Fees", "Data", "Other Fees", "USD", day, "Market data", "-10"]
+        )
+    rows.append(["Fees", "Data", "Total", "", "", "", ""])
+    return rows
+
+
+def interest_rows(year, count, language):
+    title, fields, total = INTEREST_SECTIONS[language]
+    rows = [[title, "Header"] + fields]
+    for i in range(count):
+        month = i % 12
+        day = date(year, month + 1, 3).isoformat()
+        description = f"USD Credit Interest for {MONTHS[month]}-{year}"
+        rows.append([title, "Data", "USD", day, description, "2.5"])
+    rows.append([title, "Data", total, "", "", ""])
+    return rows
+
+
+def lend_rows(year, symbols, count):
+    rows = [
+        [
+            LENDS_TITLE,
+            "Header",
+            "Currency",
+            "Value Date",
+            "Symbol",
+            "Start Date",
+            "Quantity",
+            "Collateral Amount",
+            "Interest Rate Earned by IB",
+            "Interest Paid to IB",
+            "Interest Rate on Customer Collateral",
+            "Interest Paid to Customer",
+            "Code",
+        ]
+    ]
+    for i in range(count):
+        symbol, currency, price = symbols[i % len(symbols)]
+        start = date(year, 1, 1) + timedelta(days=i * 365 // count)
+        rows.append(
+            [
+                LENDS_TITLE,
+                "Data",
+                currency,
+                (start + timedelta(days=1)).isoformat(),
+                symbol,
+                start.isoformat(),
+                "100",
+                f"{price * 100:.2f}",
+                "1.2",
+                "0.5",
+                "0.6",
+                "0.25",
+                "",
+            ]
+        )
+    rows.append([LENDS_TITLE, "Data", "Total"] + [""] * 10)
+    return rows
+
+
+def generate(
+    years,
+    symbols=20,
+    fills=100,
+    dividends=4,
+    fees=12,
+    interest=12,
+    lends=12,
+    language="en",
+    seed=0,
+):
+    # {year: rows}, positions carry over from one year to the next
+    rnd = random.Random(seed)
+    listed = make_symbols(symbols, rnd)
+    holdings = {symbol: Holding(price) for symbol, _, price in listed}
+
+    statements = {}
+    for year in sorted(years):
+        period = f"January 1, {year} - December 31, {year}"
+        rows = [
+            ["Statement", "Header", "Field Name", "Field Value"],
+            ["Statement", "Data", "BrokerName", "Interactive Brokers"],
+            ["Statement", "Data", "Period", period],
+        ]
+        rows += trade_rows(year, listed, holdings, fills, rnd)
+        rows += dividend_rows(year, listed, holdings, dividends, rnd)
+        rows += fee_rows(year, fees)
+        rows += interest_rows(year, interest, language)
+        rows += lend_rows(year, listed, lends)
+        statements[year] = rows
+
+    return statements
+
+
+def write(directory, years, **options):
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for year, rows in generate(years, **options).items():
+        path = directory / f"{year}.csv"
+        with path.open("w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        paths.append(path)
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="write synthetic IB activity statements, one per year"
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--years", default="2019,2020")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument(
+        "--fills", type=int, default=100, help="trades per symbol and year"
+    )
+    parser.add_argument(
+        "--dividends", type=int, default=4, help="payouts per symbol and year"
+    )
+    parser.add_argument("--fees", type=int, default=12)
+    parser.add_argument("--interest", type=int, default=12)
+    parser.add_argument("--lends", type=int, default=12)
+    parser.add_argument("--language", choices=("en", "ru"), default="en")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write(
+        args.directory,
+        [int(x) for x in args.years.split(",")],
+        symbols=args.symbols,
+        fills=args.fills,
+        dividends=args.dividends,
+        fees=args.fees,
+        interest=args.interest,
+        lends=args.lends,
+        language=args.language,
+        seed=args.seed,
+    )
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+from ibtax.api import Result, YearResult, compute
+from ibtax.currencies import CurrencyMap
+from ibtax.report import Report
+from ibtax.snapshot import Snapshot
+from ibtax.store import RateStore
+
+__all__ = [
+    "CurrencyMap",
+    "RateStore",
+    "Report",
+    "Result",
+    "Snapshot",
+    "YearResult",
+    "compute",
+]
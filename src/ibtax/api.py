@@ -0,0 +1,99 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List
+
+from ibtax import dividends, equities, fees, interest, lends
+from ibtax.currencies import CurrencyMap
+from ibtax.metrics import metrics
+from ibtax.report import Report
+
+logger = logging.getLogger(__name__)
+
+# YearResult field -> section module
+SECTIONS = dict(
+    equities=equities,
+    dividends=dividends,
+    fees=fees,
+    interest=interest,
+    lends=lends,
+)
+
+
+@dataclass
+class YearResult:
+    year: str
+    equities: List[equities.ProfitResult]
+    dividends: List[dividends.DividendResult]
+    fees: List[fees.FeeResult]
+    interest: List[interest.InterestResult]
+    lends: List[lends.LendResult]
+
+
+@dataclass
+class Result:
+    report: Report
+    years: Dict[str, YearResult]
+
+    def __getitem__(self, year) -> YearResult:
+        return self.years[str(year)]
+
+
+def load(report_or_paths, workers=None, cache=None) -> Report:
+    if isinstance(report_or_paths, Report):
+        return report_or_paths
+    if isinstance(report_or_paths, (str, os.PathLike)):
+        report_or_paths = [report_or_paths]
+    return Report.load(report_or_paths, workers=workers, cache=cache)
+
+
+def select_years(report, years=None, all_years=False):
+    if all_years:
+        return report.years
+    if years:
+        years = [str(x) for x in years]
+        unknown = [x for x in years if x not in report.years]
+        if unknown:
+            logger.warning(
+                "no reports for %s, covered %s",
+                ", ".join(unknown),
+                ", ".join(report.years),
+            )
+        return years
+    return [report.year]
+
+
+def compute(
+    report_or_paths,
+    currency_map: CurrencyMap,
+    years=None,
+    workers=None,
+    cache=None,
+    sections=None,
+) -> Result:
+    # the currency map is only read, one built for a wide enough period is
+    # shared by any number of calls and threads, the sections left out of
+    # sections (names of SECTIONS) are empty
+    report = load(report_or_paths, workers=workers, cache=cache)
+    years = [str(x) for x in years] if years else [report.year]
+    selected = {
+        name: module
+        for name, module in SECTIONS.items()
+        if sections is None or name in sections
+    }
+
+    partitions = {}
+    for name, module in selected.items():
+        with metrics.stage(f"partition.{name}"):
+            partitions[name] = module.by_year(report)
+
+    results = {}
+    for year in years:
+        computed = {name: [] for name in SECTIONS}
+        for name, module in selected.items():
+            with metrics.stage(f"compute.{name}"):
+                items = partitions[name].get(year, [])
+                computed[name] = module.compute(currency_map, items)
+        results[year] = YearResult(year, **computed)
+
+    return Result(report, results)
@@ -0,0 +1,232 @@
+import json
+import pathlib
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from ibtax import api
+from ibtax.cache import StatementCache
+from ibtax.ratetable import open_currency_map, write_table
+from ibtax.metrics import metrics
+from ibtax.render import write_years
+from ibtax.report import Report, cache_version
+
+
+def discover(directory: pathlib.Path):
+    # {account: [paths]}, either <dir>/<account>/*.csv or the statements
+    # as IB names them, <dir>/<account>_<from>_<to>.csv
+    accounts = defaultdict(list)
+    for path in sorted(directory.iterdir()):
+        if path.is_dir():
+            accounts[path.name].extend(sorted(path.glob("*.csv")))
+        elif path.suffix.lower() == ".csv":
+            accounts[path.stem.split("_")[0]].append(path)
+
+    return {name: paths for name, paths in accounts.items() if paths}
+
+
+@dataclass
+class AccountResult:
+    account: str
+    paths: List[pathlib.Path]
+    output: Optional[pathlib.Path] = None
+    years: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    def to_dict(self):
+        return dict(
+            account=self.account,
+            paths=[str(x) for x in self.paths],
+            output=str(self.output) if self.output else None,
+            years=self.years,
+            seconds=round(self.seconds, 6),
+            error=self.error,
+        )
+
+
+# per worker process, set up once by the pool initializer
+_worker = {}
+
+
+def _open_cache(cache):
+    # (path, version) or None, each process keeps its own stamps
+    if cache is None:
+        return None
+    return StatementCache(*cache)
+
+
+def init_worker(table, self_currency, out_of_range, cache):
+    # every worker maps the same table, the pages are shared
+    currencies_map = open_currency_map(table, out_of_range, self_currency)
+    _worker.update(currencies_map=currencies_map, cache=_open_cache(cache))
+
+
+def scan(paths, cache):
+    # -> period, currencies, error, the parsed reports stay in the cache
+    try:
+        report = Report.load(paths, workers=1, cache=_open_cache(cache))
+    except Exception:
+        return None, None, traceback.format_exc()
+    return report.period, report.currencies(), None
+
+
+def process(account, paths, output, years, all_years):
+    result = AccountResult(account, paths)
+    started = time.perf_counter()
+    try:
+        report = Report.load(paths, workers=1, cache=_worker["cache"])
+        result.years = api.select_years(report, years, all_years)
+
+        computed = api.compute(
+            report, _worker["currencies_map"], years=result.years
+        )
+
+        with output.open("w", newline="") as f:
+            write_years(f, computed)
+        result.output = output
+    except Exception:
+        result.error = traceback.format_exc()
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def run(
+    accounts,
+    output_dir: pathlib.Path,
+    build_map,
+    years=None,
+    all_years=False,
+    workers=None,
+    cache=None,
+    table=None,
+):
+    # build_map(start, end, currencies) -> CurrencyMap, called once for the
+    # union of all accounts, table is the rates table the map is of when
+    # there is one, the workers map it instead of a copy
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if cache is None:
+        # the statements are parsed once by the scan and restored by the
+        # workers from a cache of this run only
+        with tempfile.TemporaryDirectory(
+            prefix=".statements-", dir=output_dir
+        ) as directory:
+            return run(
+                accounts,
+                output_dir,
+                build_map,
+                years=years,
+                all_years=all_years,
+                workers=workers,
+                cache=(pathlib.Path(directory), cache_version()),
+                table=table,
+            )
+
+    results = {}
+    periods = {}
+    currencies = set()
+
+    with metrics.stage("batch.scan"):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                account: pool.submit(scan, paths, cache)
+                for account, paths in accounts.items()
+            }
+            for account, future in futures.items():
+                period, found, error = future.result()
+                if error is not None:
+                    results[account] = AccountResult(
+                        account, accounts[account], error=error
+                    )
+                else:
+                    periods[account] = period
+                    currencies |= found
+
+    if not periods:
+        return list(results.values())
+
+    start = min(x[0] for x in periods.values())
+    end = max(x[1] for x in periods.values())
+
+    with metrics.stage("batch.rates"):
+        currencies_map = build_map(start, end, currencies)
+        written = table is None
+        if written:
+            table = write_table(
+                output_dir / ".rates.table",
+                {
+                    name: currencies_map.series(name)
+                    for name in currencies_map.currencies()
+                },
+            )
+
+    initargs = (
+        table,
+        currencies_map.self_currency,
+        currencies_map.out_of_range,
+        cache,
+    )
+    with metrics.stage("batch.accounts"):
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=initargs,
+        ) as pool:
+            futures = [
+                pool.submit(
+                    process,
+                    account,
+                    accounts[account],
+                    output_dir / f"{account}.csv",
+                    years,
+                    all_years,
+                )
+                for account in periods
+            ]
+            for future in futures:
+                result = future.result()
+                results[result.account] = result
+
+    if written:
+        table.unlink()
+
+    metrics.count("batch.accounts", len(results))
+    metrics.count("batch.failed", sum(1 for x in results.values() if x.error))
+
+    return [results[x] for x in accounts if x in results]
+
+
+def write_summary(path: pathlib.Path, results, elapsed):
+    summary = dict(
+        accounts=len(results),
+        failed=sum(1 for x in results if x.error),
+        seconds=round(elapsed, 6),
+        results=[x.to_dict() for x in results],
+    )
+    with path.open("w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def print_summary(results, elapsed, file=None):
+    for result in results:
+        status = "FAILED" if result.error else "ok"
+        print(
+            f"{result.account:<20} {status:<6} {result.seconds:8.2f}s"
+            f" {','.join(result.years)}",
+            file=file,
+        )
+
+    failed = [x for x in results if x.error]
+    for result in failed:
+        print(f"\n{result.account}:\n{result.error}", file=file)
+
+    print(
+        f"{len(results)} accounts, {len(failed)} failed in {elapsed:.2f}s",
+        file=file,
+    )
@@ -0,0 +1,166 @@
+import csv
+import logging
+import pathlib
+from array import array
+from collections import defaultdict
+from datetime import date
+
+from ibtax.currencies import CURRENCIES, LOOKBACK_DAYS, RatesParser
+from ibtax.records import to_date
+
+logger = logging.getLogger(__name__)
+
+# rates, and the intervals held with the date they start on and the held
+# one they end on, e.g. the last days of a year that have no records
+#
+# USD,2020-01-10,61.2632,
+# USD,2019-01-01,,2020-12-31
+CSV_HEADER = ["currency", "date", "value", "held"]
+# snapshots without the intervals
+CSV_HEADER_V1 = ["currency", "date", "value"]
+
+BATCH_SIZE = 50_000
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_xml(path: pathlib.Path):
+    with path.open("rb") as f:
+        head = f.read(64).lstrip(b"\xef\xbb\xbf \t\r\n")
+    return head.startswith(b"<")
+
+
+def held_intervals(days):
+    # a snapshot of the first version keeps no intervals, CBR never skips
+    # more than the new year holidays so a longer gap between the records
+    # splits the interval
+    days = sorted(days)
+
+    intervals = []
+    start = prev = days[0]
+    for day in days[1:]:
+        if day - prev > LOOKBACK_DAYS:
+            intervals.append((start, prev))
+            start = day
+        prev = day
+    intervals.append((start, prev))
+
+    return [(date.fromordinal(a), date.fromordinal(b)) for a, b in intervals]
+
+
+def import_csv(store, path: pathlib.Path):
+    days = defaultdict(lambda: array("l"))
+    held = []
+    ordinals = {}
+    batch = []
+
+    def flush():
+        store.insert_many(batch)
+        batch.clear()
+
+    with path.open(newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header not in (CSV_HEADER, CSV_HEADER_V1):
+            raise ValueError(f"{path} is not a rates snapshot: {header}")
+
+        for currency, raw_date, value, *until in reader:
+            if until and until[0]:
+                held.append(
+                    (currency.upper(), to_date(raw_date), to_date(until[0]))
+                )
+                continue
+
+            day = ordinals.get(raw_date)
+            if day is None:
+                day = ordinals[raw_date] = to_date(raw_date).toordinal()
+            currency = currency.upper()
+            batch.append((currency, day, float(value)))
+            days[currency].append(day)
+
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+    flush()
+
+    if header == CSV_HEADER_V1:
+        for currency, items in days.items():
+            held.extend((currency, *x) for x in held_intervals(items))
+    for currency, start, end in held:
+        store.mark(currency, start, end)
+
+    return {currency: len(items) for currency, items in days.items()}
+
+
+def import_xml(store, path: pathlib.Path, currency=None):
+    # a saved XML_dynamic.asp response
+    parser = RatesParser()
+    imported = 0
+    name = currency
+
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            records = parser.feed(chunk, final=not chunk)
+
+            if name is None and parser.rq is not None:
+                name = currency_name(store, parser.rq)
+            if records:
+                if name is None:
+                    raise ValueError(
+                        f"{path} has no currency id, pass the currency"
+                    )
+                store.insert(name, records)
+                imported += len(records)
+
+            if not chunk:
+                break
+
+    if name is not None and parser.start is not None:
+        store.mark(name, parser.start, parser.end)
+
+    return {name: imported}
+
+
+def currency_name(store, rq):
+    catalog = dict(CURRENCIES)
+    catalog.update(store.catalog())
+
+    for name, known_rq in catalog.items():
+        if known_rq == rq:
+            return name
+
+    raise ValueError(f"unknown CBR currency id {rq}, pass the currency")
+
+
+def import_file(store, path, currency=None):
+    path = pathlib.Path(path)
+    if is_xml(path):
+        return import_xml(store, path, currency)
+    return import_csv(store, path)
+
+
+def export_csv(store, path, currencies=None):
+    path = pathlib.Path(path)
+
+    exported = 0
+    with path.open("w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(CSV_HEADER)
+        for currency, day, value in store.dump(currencies):
+            w.writerow(
+                [currency, date.fromordinal(day).isoformat(), value, ""]
+            )
+            exported += 1
+
+        for currency in currencies or store.currencies():
+            for start, end in store.intervals(currency):
+                w.writerow(
+                    [
+                        currency,
+                        date.fromordinal(start).isoformat(),
+                        "",
+                        date.fromordinal(end).isoformat(),
+                    ]
+                )
+
+    return exported
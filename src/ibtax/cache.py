@@ -1,5 +1,13 @@
+import hashlib
+import logging
+import os
 import pathlib
 import pickle
+import threading
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
 
 
 class PickleCache:
@@ -16,6 +24,73 @@ class PickleCache:
                 return pickle.load(f)
 
     def set(self, key, value):
+        # written aside and moved, a concurrent run never sees a partial file
         path = self._path(key)
-        with path.open("wb") as f:
-            pickle.dump(value, f)
+        tmp = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        with tmp.open("wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+
+def file_digest(path: pathlib.Path):
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StatementCache:
+    # parsed statements keyed by the file content, a path with the same size
+    # and mtime as on the previous run is not hashed again
+    #
+    # every path has a stamp entry of its own, the processes of a batch
+    # share the cache and never overwrite each other's stamps
+    def __init__(self, path: pathlib.Path, version: str):
+        path.mkdir(parents=True, exist_ok=True)
+        self.version = version
+        self._entries = PickleCache(path)
+        # path -> (size, mtime), digest seen by this process, the server
+        # threads share it, the files are hashed outside the lock
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        try:
+            return self._entries.get(key)
+        except (EOFError, pickle.UnpicklingError) as e:
+            logger.warning("ignoring a broken cache entry %s: %r", key, e)
+            return None
+
+    @staticmethod
+    def _stamp_key(path):
+        return "stamp-" + hashlib.sha256(path.encode()).hexdigest()[:32]
+
+    def key(self, path):
+        path = str(pathlib.Path(path).resolve())
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            known = self._stamps.get(path)
+        if known is None or known[0] != stamp:
+            known = self._load(self._stamp_key(path))
+
+        if known is not None and known[0] == stamp:
+            digest = known[1]
+        else:
+            digest = file_digest(pathlib.Path(path))
+            self._entries.set(self._stamp_key(path), (stamp, digest))
+
+        with self._lock:
+            self._stamps[path] = (stamp, digest)
+
+        return f"{digest}-{self.version}"
+
+    def get(self, path):
+        return self._load(self.key(path))
+
+    def set(self, path, value):
+        self._entries.set(self.key(path), value)
@@ -1,107 +1,398 @@
-import urllib.parse
-import urllib.request
-from dataclasses import dataclass
-from datetime import datetime, timedelta, date
-from typing import Iterable
+import logging
+import queue
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import repeat
+from typing import Iterable, Tuple
 from xml.dom import minidom
+from xml.parsers import expat
+
+from ibtax.metrics import metrics
+from ibtax.transport import HttpTransport
+
+logger = logging.getLogger(__name__)
 
 # https://www.cbr.ru/scripts/XML_val.asp?d=0
 RQ_USD = "R01235"
 RQ_CAD = "R01350"
 
+# known upfront, anything else is resolved through the CBR catalog
 CURRENCIES = dict(USD=RQ_USD, CAD=RQ_CAD)
 
+LOOKBACK_DAYS = 14
+
 
 def to_cb_date_format(dt):
     return dt.strftime("%d/%m/%Y")
 
 
-@dataclass
-class CurrencyRatio:
-    day: date
-    value: float
-
+def from_cb_date(value):
+    # 01.02.2020
+    return date(int(value[6:10]), int(value[3:5]), int(value[0:2]))
+
+
+class RatesParser:
+    # incremental XML_dynamic parser, no DOM is built
+    #
+    # <ValCurs ID="R01235" ...>
+    #   <Record Date="01.02.2020" Id="R01235">
+    #     <Nominal>1</Nominal><Value>63,1385</Value>
+    #   </Record>
+    # </ValCurs>
+    def __init__(self):
+        self.parsed = []
+        # from the ValCurs element, CBR currency id and the requested range
+        self.rq = None
+        self.start = None
+        self.end = None
+        self._day = None
+        self._value = None
+        self._nominal = 1
+        self._field = None
+        self._text = []
+
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+
+    def _start(self, name, attrs):
+        if name == "Record":
+            self._day = from_cb_date(attrs["Date"])
+            self._value = None
+            self._nominal = 1
+        elif name == "ValCurs":
+            self.rq = attrs.get("ID")
+            if attrs.get("DateRange1") and attrs.get("DateRange2"):
+                self.start = from_cb_date(attrs["DateRange1"])
+                self.end = from_cb_date(attrs["DateRange2"])
+        elif name in ("Value", "Nominal"):
+            self._field = name
+            self._text = []
+
+    def _data(self, data):
+        if self._field is not None:
+            self._text.append(data)
+
+    def _end(self, name):
+        if name == self._field:
+            text = "".join(self._text).strip()
+            if name == "Value":
+                self._value = float(text.replace(",", "."))
+            else:
+                self._nominal = int(text)
+            self._field = None
+        elif name == "Record":
+            # some rates are quoted per 10 or 100 units, e.g. HKD
+            self.parsed.append(
+                (self._day.toordinal(), self._value / self._nominal)
+            )
+
+    def feed(self, chunk, final=False):
+        # -> [(day ordinal, value), ...] of the records completed so far
+        self._parser.Parse(chunk, final)
+        parsed, self.parsed = self.parsed, []
+        return parsed
+
+
+def parse_rates(chunks):
+    # yields batches of (day ordinal, value) while the chunks arrive
+    parser = RatesParser()
+    for chunk in chunks:
+        parsed = parser.feed(chunk)
+        if parsed:
+            yield parsed
+
+    parsed = parser.feed(b"", final=True)
+    if parsed:
+        yield parsed
+
+
+def stream_rates(transport, rq, start, end):
+    chunks = transport.stream(
+        "/scripts/XML_dynamic.asp",
+        dict(
+            date_req1=to_cb_date_format(start),
+            date_req2=to_cb_date_format(end),
+            VAL_NM_RQ=rq,
+        ),
+    )
+    return parse_rates(chunks)
 
-def load_currency(rq, start, end):
-    start = to_cb_date_format(start)
-    end = to_cb_date_format(end)
 
-    url = (
-        f"https://www.cbr.ru/scripts/XML_dynamic.asp"
-        f"?date_req1={start}&date_req2={end}&VAL_NM_RQ={rq}"
-    )
-    f = urllib.request.urlopen(url)
-    contents = f.read().decode("utf-8")
+def load_catalog(transport):
+    # {ISO code: CBR currency id}
+    contents = transport.get("/scripts/XML_val.asp", dict(d=0))
 
     dom = minidom.parseString(contents)
-    root = dom.getElementsByTagName("ValCurs")[0]
 
-    def walk():
-        for node in root.getElementsByTagName("Record"):
-            value = node.getElementsByTagName("Value")[0].firstChild.nodeValue
-            value = float(value.replace(",", "."))
+    catalog = {}
+    for node in dom.getElementsByTagName("Item"):
+        codes = node.getElementsByTagName("ISO_Char_Code")
+        if not codes or codes[0].firstChild is None:
+            continue
+
+        code = codes[0].firstChild.nodeValue.strip().upper()
+        rq = node.attributes["ID"].value.strip()
+
+        # a currency could be listed under several ids, the base one is
+        # its own parent
+        parents = node.getElementsByTagName("ParentCode")
+        is_base = (
+            parents
+            and parents[0].firstChild is not None
+            and parents[0].firstChild.nodeValue.strip() == rq
+        )
+        if code not in catalog or is_base:
+            catalog[code] = rq
 
-            date_str = node.attributes["Date"].value
-            d = datetime.strptime(date_str, "%d.%m.%Y").date()
-            yield CurrencyRatio(d, value)
+    return catalog
 
-    return list(walk())
 
+def resolve_currencies(store, transport, names):
+    # {name: CBR currency id}, the catalog is refreshed on unknown names
+    catalog = dict(CURRENCIES)
+    catalog.update(store.catalog())
 
-def fill_gaps(seq):
-    mem = dict(cur=seq[0])
+    if any(name not in catalog for name in names):
+        catalog.update(load_catalog(transport))
+        store.set_catalog(catalog)
 
-    def walk():
-        yield seq[0]
+    unknown = [name for name in names if name not in catalog]
+    if unknown:
+        raise RateNotFound(f"unknown currencies {', '.join(unknown)}")
 
-        for cur in seq[1:]:
-            prev_date = mem["cur"].day
-            prev_value = mem["cur"].value
+    return {name: catalog[name] for name in names}
 
-            diff = (cur.day - prev_date).days
-            for i in range(1, diff):
-                yield CurrencyRatio(prev_date + timedelta(days=i), prev_value)
 
-            yield cur
-            mem["cur"] = cur
+class RateNotFound(KeyError):
+    pass
 
-    return list(walk())
 
+# what to do with a date after the loaded rates, a date before them is
+# always an error
+OUT_OF_RANGE_ERROR = "error"
+OUT_OF_RANGE_LAST_KNOWN = "last"
+OUT_OF_RANGE_POLICIES = (OUT_OF_RANGE_ERROR, OUT_OF_RANGE_LAST_KNOWN)
 
-def prepare_currency(cache, rq, start, end):
-    key_name = f".{rq}.{start}-{end}.pickle"
 
-    cached = cache.get(key_name)
-    if cached:
-        return cached
+class RateSeries:
+    # a rate per calendar day starting from the base ordinal, days without
+    # a record (weekends, holidays) carry the previous value
+    def __init__(self, base: int, values: array):
+        self.base = base
+        self.values = values
 
-    seq = load_currency(rq, start, end)
-    seq = fill_gaps(seq)
+    def __len__(self):
+        return len(self.values)
 
-    cache.set(key_name, seq)
+    @property
+    def first(self) -> date:
+        return date.fromordinal(self.base)
 
-    return seq
+    @property
+    def last(self) -> date:
+        return date.fromordinal(self.base + len(self.values) - 1)
+
+    @classmethod
+    def from_days(cls, seq: Iterable[Tuple[int, float]]) -> "RateSeries":
+        # (day ordinal, value) sorted by day
+        values = array("d")
+        base = None
+
+        for day, value in seq:
+            if base is None:
+                base = day
+            else:
+                gap = day - base - len(values)
+                if gap < 0:
+                    raise ValueError(
+                        f"rates are not sorted at {date.fromordinal(day)}"
+                    )
+                values.extend(repeat(values[-1], gap))
+            values.append(value)
+
+        if base is None:
+            raise ValueError("no rates to build a series from")
+
+        return cls(base, values)
+
+    def extend(self, last: int):
+        # carry the last value up to the given day ordinal
+        gap = last - self.base - len(self.values) + 1
+        if gap > 0:
+            self.values.extend(repeat(self.values[-1], gap))
+
+    def get(self, day: date, out_of_range=OUT_OF_RANGE_ERROR) -> float:
+        idx = day.toordinal() - self.base
+        if 0 <= idx < len(self.values):
+            return self.values[idx]
+
+        # there is no known rate before the first one
+        if idx >= 0 and out_of_range == OUT_OF_RANGE_LAST_KNOWN:
+            return self.values[-1]
+
+        raise RateNotFound(
+            f"no rate for {day}, known from {self.first} to {self.last}"
+        )
+
+
+def read_currencies(store, names, start, end):
+    # only what is in the store, e.g. imported from a rates bundle
+    for name in names:
+        missing = store.missing(name, start, min(end, date.today()))
+        if missing:
+            logger.warning(
+                "offline, %s rates are missing for %s",
+                name,
+                ", ".join(f"{a} - {b}" for a, b in missing),
+            )
+
+    return {name: store.read(name, start, end) for name in names}
+
+
+def prepare_currencies(store, transport, currencies, start, end, workers):
+    # fetch a bit earlier, the first days of a year are holidays and
+    # take the rate of the last working day
+    fetch_start = start - timedelta(days=LOOKBACK_DAYS)
+    # rates for the future are not published yet, don't mark them as held
+    fetch_end = min(end, date.today())
+
+    jobs = [
+        (name, rq, gap_start, gap_end)
+        for name, rq in currencies.items()
+        for gap_start, gap_end in store.missing(name, fetch_start, fetch_end)
+    ]
+
+    fetched = {job[0] for job in jobs}
+    metrics.count("rates.store_hits", len(currencies) - len(fetched))
+    metrics.count("rates.store_misses", len(fetched))
+    metrics.count("rates.fetched_gaps", len(jobs))
+
+    # responses are parsed on the pool threads as they are read, the parsed
+    # batches are written from this thread since the store is not shared
+    batches = queue.Queue()
+
+    def fetch(job):
+        _, rq, gap_start, gap_end = job
+        try:
+            for batch in stream_rates(transport, rq, gap_start, gap_end):
+                batches.put((job, batch))
+        except Exception as e:
+            batches.put((job, e))
+        else:
+            batches.put((job, None))
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for job in jobs:
+            pool.submit(fetch, job)
+
+        pending = len(jobs)
+        while pending:
+            job, batch = batches.get()
+            name, _, gap_start, gap_end = job
+
+            if isinstance(batch, Exception):
+                errors.append(batch)
+                pending -= 1
+            elif batch is None:
+                store.mark(name, gap_start, gap_end)
+                pending -= 1
+            else:
+                store.insert(name, batch)
+                metrics.count("rates.fetched_records", len(batch))
+
+    if errors:
+        raise errors[0]
+
+    return {name: store.read(name, start, end) for name in currencies}
 
 
 class CurrencyMap:
-    def __init__(self, self_cur):
+    def __init__(self, self_cur, out_of_range=OUT_OF_RANGE_ERROR, loader=None):
+        if out_of_range not in OUT_OF_RANGE_POLICIES:
+            raise ValueError(f"unknown out of range policy {out_of_range}")
+
         self.__map = {}
         self.__self_cur = self_cur
+        self.__out_of_range = out_of_range
+        # loads a currency series on its first use
+        self.__loader = loader
+        self.__lock = threading.Lock()
+
+    def __contains__(self, cur: str):
+        return cur == self.__self_cur or cur in self.__map
+
+    @property
+    def self_currency(self):
+        return self.__self_cur
+
+    @property
+    def out_of_range(self):
+        return self.__out_of_range
+
+    def currencies(self):
+        return sorted(self.__map)
 
-    def add(self, cur: str, seq: Iterable[CurrencyRatio]):
-        self.__map[cur] = {x.day: x.value for x in seq}
+    def add(self, cur: str, series: RateSeries):
+        self.__map[cur] = series
+
+    def series(self, cur: str) -> RateSeries:
+        series = self.__map.get(cur)
+        if series is not None:
+            return series
+
+        if self.__loader is None:
+            raise RateNotFound(f"no rates loaded for {cur}")
+
+        with self.__lock:
+            series = self.__map.get(cur)
+            if series is None:
+                metrics.count("rates.lazy_loads")
+                series = self.__map[cur] = self.__loader(cur)
+            return series
 
     def get(self, cur: str, day: date) -> float:
         if cur == self.__self_cur:
             return 1.0
-        return self.__map[cur][day]
+        return self.series(cur).get(day, self.__out_of_range)
 
     @classmethod
-    def build(cls, cache, start, end) -> "CurrencyMap":
-        m = cls("RUB")
-
-        for name, rq in CURRENCIES.items():
-            seq = prepare_currency(cache, rq, start, end)
-            m.add(name, seq)
+    def build(
+        cls,
+        store,
+        start,
+        end,
+        out_of_range=OUT_OF_RANGE_ERROR,
+        transport=None,
+        workers=None,
+        currencies=(),
+        offline=False,
+    ) -> "CurrencyMap":
+        # currencies are prefetched together, any other is loaded lazily
+        if transport is None and not offline:
+            transport = HttpTransport()
+
+        def load(names):
+            if offline:
+                return read_currencies(store, names, start, end)
+            return prepare_currencies(
+                store,
+                transport,
+                resolve_currencies(store, transport, names),
+                start,
+                end,
+                workers,
+            )
+
+        m = cls("RUB", out_of_range, loader=lambda name: load([name])[name])
+
+        names = sorted({x for x in currencies if x and x not in m})
+        for name, series in load(names).items():
+            m.add(name, series)
 
         return m
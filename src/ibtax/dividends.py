@@ -1,11 +1,15 @@
 import logging
 import re
-from collections import namedtuple
+from collections import defaultdict
 from dataclasses import dataclass
-from datetime import datetime
+from typing import List
 
+from ibtax import money, vector
 from ibtax.currencies import CurrencyMap
-from ibtax.formatting import to_f
+from ibtax.formatting import to_f, to_k
+from ibtax.metrics import metrics
+from ibtax.records import Record, group_by_year, to_date
+from ibtax.schema import register
 
 logger = logging.getLogger(__name__)
 
@@ -15,99 +19,128 @@ def parse_symbol(value):
     return re.match(r"^(?P<symbol>\w+)\s*\(.*", value).group("symbol")
 
 
-class Payout(
-    namedtuple(
-        "Payout",
-        [
-            "dividends",
-            "header",
-            "raw_currency",
-            "raw_date",
-            "description",
-            "raw_amount",
-        ],
+class Payout(Record):
+    __slots__ = ("currency", "date", "description", "symbol", "value")
+
+    # Dividends,Data,Currency,Date,Description,Amount
+    schema = register(
+        "dividends",
+        ("currency", ("Currency", "Валюта"), 2),
+        ("date", ("Date", "Дата"), 3),
+        ("description", ("Description", "Описание"), 4),
+        ("value", ("Amount", "Сумма"), 5),
     )
-):
-    @property
-    def currency(self):
-        return self.raw_currency.upper()
 
-    @property
-    def datetime(self):
-        return datetime.strptime(self.raw_date, "%Y-%m-%d")
+    def __init__(self, currency, date, description, symbol, value):
+        self.currency = currency
+        self.date = date
+        self.description = description
+        self.symbol = symbol
+        # signed, reversals are negative
+        self.value = value
 
     @property
     def amount(self):
-        return abs(float(self.raw_amount))
+        return abs(self.value)
 
-    @property
-    def symbol(self):
-        return parse_symbol(self.description)
+    @classmethod
+    def from_row(cls, values):
+        # values of the schema columns
+        currency, date, description, value = values
+        return cls(
+            currency=currency.upper(),
+            date=to_date(date),
+            description=description,
+            symbol=parse_symbol(description),
+            value=float(value),
+        )
+
+    @classmethod
+    def subscribe(cls, reader, consumer):
+        def consume(values):
+            if "total" not in values[0].lower():
+                consumer(cls.from_row(values))
+
+        reader.subscribe("dividends", consume, schema=cls.schema)
 
     @classmethod
     def parse(cls, report):
+        year = int(report.year)
+
         def walk():
-            for row in report.rows:
-                if (
-                    row[0].lower() == "dividends"
-                    and row[1].lower() == "data"
-                    and "total" not in row[2].lower()
-                    and report.year in row[3].lower()
-                ):
-                    yield cls(*row)
+            for item in report.records(cls):
+                if item.date.year == year:
+                    yield item
 
         return list(walk())
 
 
-@dataclass
-class Withhold:
-    withholding_tax: str
-    header: str
-    raw_currency: str
-    raw_date: str
-    description: str
-    raw_amount: str
-    code: str
+class Withhold(Record):
+    __slots__ = ("currency", "date", "description", "symbol", "value", "code")
+
+    # Withholding Tax,Data,Currency,Date,Description,Amount,Code
+    schema = register(
+        "withholding tax",
+        ("currency", ("Currency", "Валюта"), 2),
+        ("date", ("Date", "Дата"), 3),
+        ("description", ("Description", "Описание"), 4),
+        ("value", ("Amount", "Сумма"), 5),
+        ("code", ("Code", "Код"), 6),
+    )
+
+    def __init__(self, currency, date, description, symbol, value, code):
+        self.currency = currency
+        self.date = date
+        self.description = description
+        self.symbol = symbol
+        # signed, withholding is negative and reversals are positive
+        self.value = value
+        self.code = code
 
     @classmethod
     def blank(cls):
         return cls(
-            withholding_tax="",
-            header="",
-            raw_currency="",
-            raw_date="",
+            currency="",
+            date=None,
             description="",
-            raw_amount="0",
+            symbol="",
+            value=0.0,
             code="",
         )
 
     @property
-    def currency(self):
-        return self.raw_currency.upper()
+    def amount(self):
+        return abs(self.value)
 
-    @property
-    def datetime(self):
-        return datetime.strptime(self.raw_date, "%Y-%m-%d")
+    @classmethod
+    def from_row(cls, values):
+        # values of the schema columns
+        currency, date, description, value, code = values
+        return cls(
+            currency=currency.upper(),
+            date=to_date(date),
+            description=description,
+            symbol=parse_symbol(description),
+            value=float(value),
+            code=code,
+        )
 
-    @property
-    def amount(self):
-        return abs(float(self.raw_amount))
+    @classmethod
+    def subscribe(cls, reader, consumer):
+        def consume(values):
+            if "total" not in values[0].lower():
+                consumer(cls.from_row(values))
 
-    @property
-    def symbol(self):
-        return parse_symbol(self.description)
+        reader.subscribe("withholding tax", consume, schema=cls.schema)
 
     @classmethod
     def parse(cls, report):
+        year = int(report.year)
+
         def walk():
-            for row in report.rows:
-                if (
-                    row[0].lower() == "withholding tax"
-                    and row[1].lower() == "data"
-                    and "total" not in row[2].lower()
-                    and report.year in row[3].lower()
-                ):
-                    yield cls(*row)
+            for item in report.records(cls):
+                if item.date.year == year:
+                    yield item
 
         return list(walk())
 
@@ -118,63 +151,165 @@ class Event:
     withhold: Withhold
 
 
+@dataclass
+class Matching:
+    events: List[Event]
+    unmatched_payouts: List[Payout]
+    unmatched_withholds: List[Withhold]
+
+    def summary(self):
+        return dict(
+            events=len(self.events),
+            unmatched_payouts=[match_key(x) for x in self.unmatched_payouts],
+            unmatched_withholds=[
+                match_key(x) for x in self.unmatched_withholds
+            ],
+        )
+
+
+def match_key(item):
+    return item.symbol, item.date, item.currency
+
+
+def combine(items):
+    # reversals and adjustments of the same payment are summed up
+    if len(items) == 1:
+        return items[0]
+
+    total = sum(x.value for x in items)
+    return items[0].replace(value=round(total, 8))
+
+
+def match(payouts, withholds):
+    payouts_by_key = defaultdict(list)
+    for p in payouts:
+        payouts_by_key[match_key(p)].append(p)
+
+    withholds_by_key = defaultdict(list)
+    for w in withholds:
+        withholds_by_key[match_key(w)].append(w)
+
+    events = []
+    unmatched_payouts = []
+    for key, items in payouts_by_key.items():
+        p = combine(items)
+
+        matched = withholds_by_key.pop(key, None)
+        if matched:
+            w = combine(matched)
+        else:
+            unmatched_payouts.append(p)
+            w = Withhold.blank()
+
+        events.append(Event(p, w))
+
+    unmatched_withholds = [
+        combine(items) for items in withholds_by_key.values()
+    ]
+
+    return Matching(events, unmatched_payouts, unmatched_withholds)
+
+
 def get_events(report):
-    payouts = Payout.parse(report)
-    withholds = Withhold.parse(report)
+    matching = match(Payout.parse(report), Withhold.parse(report))
+    log_unmatched(matching)
+    return matching.events
 
-    def walk():
-        for p in payouts:
-            w = None
 
-            while withholds:
-                w = withholds.pop(0)
-                if p.symbol == w.symbol:
-                    # drop those that are not matching
-                    break
-                logger.warning("skipping %s", w)
+def log_unmatched(matching):
+    if matching.unmatched_payouts or matching.unmatched_withholds:
+        logger.warning("unmatched dividends: %s", matching.summary())
 
-            if w is None:
-                logger.warning(f"can't match withhold for {p}")
-                w = Withhold.blank()
 
-            yield Event(p, w)
+@dataclass
+class DividendResult:
+    event: Event
+    rate: float
+    # kopecks
+    amount_rub: int
+    tax_paid_rub: int
+    tax_to_pay: int
+
+
+def convert(currencies_map: CurrencyMap, events):
+    # -> rates, amounts, tax paid and tax to pay in kopecks
+    payouts = [x.payout for x in events]
+
+    rates = vector.rates(
+        currencies_map,
+        [x.currency for x in payouts],
+        [x.date for x in payouts],
+    )
+    rate_units = money.to_rate_units(rates)
+    amounts_rub = money.convert_amounts(
+        [x.amount for x in payouts], rate_units
+    )
+    taxes_paid_rub = money.convert_amounts(
+        [x.withhold.amount for x in events], rate_units
+    )
 
-    return list(walk())
+    return (
+        rates,
+        amounts_rub,
+        taxes_paid_rub,
+        money.to_pay(amounts_rub, taxes_paid_rub),
+    )
 
 
-def to_row(currencies_map: CurrencyMap, event):
+def format_row(result: DividendResult):
+    event = result.event
     p = event.payout
     w = event.withhold
 
-    currency_rate = currencies_map.get(p.currency, p.datetime.date())
-
-    amount_rub = currency_rate * p.amount
-    tax_paid_rub = currency_rate * w.amount
-
     return [
         # symb
         p.symbol,
         # date
-        p.datetime.strftime("%Y.%m.%d"),
+        p.date.strftime("%Y.%m.%d"),
         # amount usd
         to_f(p.amount),
         # currency
         p.currency,
         # currency rate
-        to_f(currency_rate),
+        to_f(result.rate),
         # tab base rub
-        to_f(amount_rub),
+        to_k(result.amount_rub),
         # tax payed usd
         to_f(w.amount),
         # tax payed rub
-        to_f(tax_paid_rub),
+        to_k(result.tax_paid_rub),
         # tax to pay rub
-        to_f(max(0, 0.13 * amount_rub - tax_paid_rub)),
+        to_k(result.tax_to_pay),
+    ]
+
+
+def compute(currencies_map: CurrencyMap, events):
+    return [
+        DividendResult(*values)
+        for values in zip(events, *convert(currencies_map, events))
     ]
 
 
-def show(w, currencies_map, report):
-    events = get_events(report)
+def to_rows(currencies_map: CurrencyMap, events):
+    return [format_row(x) for x in compute(currencies_map, events)]
+
+
+def to_row(currencies_map: CurrencyMap, event):
+    return to_rows(currencies_map, [event])[0]
+
+
+def by_year(report):
+    # matched over the whole history, events go to the payout year
+    matching = match(report.records(Payout), report.records(Withhold))
+    log_unmatched(matching)
+
+    metrics.count("dividends.events", len(matching.events))
+    metrics.count(
+        "dividends.unmatched",
+        len(matching.unmatched_payouts) + len(matching.unmatched_withholds),
+    )
+    return group_by_year(matching.events, lambda x: x.payout.date)
+
 
-    for event in events:
-        w.writerow(to_row(currencies_map, event))
+def write(w, results):
+    w.writerows(format_row(x) for x in results)
@@ -1,79 +1,160 @@
+import csv
+import heapq
+import io
 import logging
-from collections import namedtuple, defaultdict
-from datetime import datetime
-
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List
+
+from ibtax import money, vector
 from ibtax.currencies import CurrencyMap
-from ibtax.formatting import to_f4, to_f
+from ibtax.formatting import to_f4, to_f, to_k
+from ibtax.lots import Position
+from ibtax.metrics import metrics
+from ibtax.records import (
+    Record,
+    to_datetime,
+    to_float,
+    to_price,
+    to_quantity,
+)
+from ibtax.schema import register
 
 logger = logging.getLogger(__name__)
 
-
-class Trade(
-    namedtuple(
-        "Trade",
-        [
-            "type",
-            "header",
-            "data_discriminator",
-            "asset_category",
-            "raw_currency",
-            "symbol",
-            "raw_datetime",
-            "raw_quantity",
-            "raw_t_price",
-            "c_price",
-            "proceeds",
-            "raw_comm_fee",
-            "basis",
-            "raw_realized_pl",
-            "mtm_pl",
-            "code",
-        ],
+# below this many trades a pool costs more than the equities themselves
+PARALLEL_TRADES = 20000
+# chunks per worker, the uneven symbols even out over several of them
+CHUNKS_PER_WORKER = 4
+
+
+class Trade(Record):
+    __slots__ = (
+        "asset_category",
+        "currency",
+        "symbol",
+        "datetime",
+        "_quantity",
+        "_t_price",
+        "comm_fee",
+        "realized_pl",
+        "code",
+    )
+    fields = (
+        "asset_category",
+        "currency",
+        "symbol",
+        "datetime",
+        "quantity",
+        "t_price",
+        "comm_fee",
+        "realized_pl",
+        "code",
     )
-):
-    @property
-    def quantity(self):
-        # splits may contain non integer values
-        try:
-            return int(self.raw_quantity)
-        except ValueError:
-            logger.warning("unexpected quantity in a trade %s", self)
-            return int(float(self.raw_quantity))
 
-    @property
-    def realized_pl(self):
-        return float(self.raw_realized_pl or 0)
+    # Trades,Data,DataDiscriminator,Asset Category,Currency,Symbol,
+    # Date/Time,Quantity,T. Price,C. Price,Proceeds,Comm/Fee,Basis,
+    # Realized P/L,MTM P/L,Code
+    schema = register(
+        "trades",
+        ("asset_category", ("Asset Category", "Класс актива"), 3),
+        ("currency", ("Currency", "Валюта"), 4),
+        ("symbol", ("Symbol", "Символ"), 5),
+        ("datetime", ("Date/Time", "Дата/Время"), 6),
+        ("quantity", ("Quantity", "Количество"), 7),
+        ("t_price", ("T. Price", "Цена транзакции"), 8),
+        ("comm_fee", ("Comm/Fee", "Комиссия/плата"), 11),
+        ("realized_pl", ("Realized P/L", "Реализованная П/У"), 13),
+        ("code", ("Code", "Код"), 15),
+    )
 
-    @property
-    def datetime(self):
-        return datetime.strptime(self.raw_datetime, "%Y-%m-%d, %H:%M:%S")
+    def __init__(
+        self,
+        asset_category,
+        currency,
+        symbol,
+        datetime,
+        quantity,
+        t_price,
+        comm_fee,
+        realized_pl,
+        code,
+    ):
+        self.asset_category = asset_category
+        self.currency = currency
+        self.symbol = symbol
+        self.datetime = datetime
+        # the raw strings of a row are converted on the first use, most of
+        # the trades of other assets never are
+        self._quantity = quantity
+        self._t_price = t_price
+        self.comm_fee = comm_fee
+        self.realized_pl = realized_pl
+        self.code = code
 
     @property
-    def currency(self):
-        return self.raw_currency.upper()
+    def quantity(self):
+        value = self._quantity
+        if type(value) is str:
+            value = self._quantity = to_quantity(value)
+        return value
 
     @property
     def t_price(self):
-        return float(self.raw_t_price)
+        value = self._t_price
+        if type(value) is str:
+            value = self._t_price = to_price(value)
+        return value
 
-    @property
-    def comm_fee(self):
-        return float(self.raw_comm_fee)
+    @classmethod
+    def from_row(cls, values):
+        # values of the schema columns
+        (
+            asset_category,
+            currency,
+            symbol,
+            datetime,
+            quantity,
+            t_price,
+            comm_fee,
+            realized_pl,
+            code,
+        ) = values
+        return cls(
+            asset_category=asset_category,
+            currency=currency.upper(),
+            symbol=symbol,
+            datetime=to_datetime(datetime),
+            quantity=quantity,
+            t_price=t_price,
+            comm_fee=to_float(comm_fee),
+            realized_pl=to_float(realized_pl),
+            code=code,
+        )
 
     @classmethod
-    def parse(cls, report):
-        def walk():
-            for row in report.rows:
-                if row[0].lower() == "trades" and row[1].lower() == "data":
-                    yield cls(*row)
+    def subscribe(cls, reader, consumer):
+        reader.subscribe(
+            "trades",
+            lambda values: consumer(cls.from_row(values)),
+            schema=cls.schema,
+        )
 
-        return list(walk())
+    @classmethod
+    def parse(cls, report):
+        return list(report.records(cls))
 
 
 class SymbolTrades:
-    def __init__(self, symbol, trades):
+    def __init__(self, symbol, trades, lots=()):
         self.symbol = symbol
         self.trades = trades
+        # [(quantity, trade), ...] open before the trades, of a snapshot
+        self.lots = lots
 
     def __repr__(self):
         return "{}".format(self.symbol)
@@ -85,23 +166,36 @@ class SymbolTrades:
 
         return False
 
-    def buy_trades(self):
-        return [t for t in self.trades if t.quantity > 0]
 
-    def sell_trades(self):
-        return [t for t in self.trades if t.quantity < 0]
-
-
-def group_trades(trades):
+def group_trades(trades, lots=None):
+    # lots are {symbol: [(quantity, trade), ...]} open before the trades
+    lots = lots or {}
     res = defaultdict(list)
+    for symbol in lots:
+        res[symbol] = []
     for trade in trades:
         res[trade.symbol].append(trade)
 
     return [
-        SymbolTrades(symbol, trades) for symbol, trades in sorted(res.items())
+        SymbolTrades(symbol, trades, lots.get(symbol, ()))
+        for symbol, trades in sorted(res.items())
     ]
 
 
+def report_trades(report):
+    # -> trades, open lots of a report started from a snapshot, the trades
+    # up to the snapshot year end are in the lots already
+    trades = Trade.parse(report)
+    if report.lots is None:
+        return trades, None
+
+    year = int(report.lots.year)
+    found = [x for x in trades if x.datetime.year > year]
+    if len(found) < len(trades):
+        metrics.count("equities.trades_in_lots", len(trades) - len(found))
+    return found, report.lots.lots
+
+
 class QuantityOrder:
     def __init__(self, quantity, trade):
         self.quantity = quantity
@@ -109,145 +203,404 @@ class QuantityOrder:
 
 
 class TakeProfit:
-    def __init__(self, buys, sell):
+    def __init__(
+        self, buys, sell, quantity=None, closing=None, realized_pl=None
+    ):
         self.buys = buys
         self.sell = sell
+        # a sell could be matched partially, the rest opens a short
+        self.quantity = abs(sell.quantity) if quantity is None else quantity
+        # the trade realising the profit, a buy when a short is covered
+        self.closing = sell if closing is None else closing
+        # of the closing trade, its share when it covers several shorts
+        self.realized_pl = (
+            self.closing.realized_pl if realized_pl is None else realized_pl
+        )
 
     @property
     def year(self):
-        return str(self.sell.datetime.year)
+        return str(self.closing.datetime.year)
 
 
-def to_rows(currencies: CurrencyMap, take_profit):
-    symbol = take_profit.sell.symbol
+def rated_trades(take_profit):
+    # trades needing a rate, in the to_rows order
+    return [x.trade for x in take_profit.buys] + [take_profit.sell]
 
-    def walk():
-        agg = dict(buy=0, buy_rub=0, fee=0, fee_rub=0)
 
-        for q_order in take_profit.buys:
-            trade = q_order.trade
+def convert(currencies: CurrencyMap, take_profits):
+    # -> rates of rated_trades() of all take profits in a single batch
+    trades = [x for tp in take_profits for x in rated_trades(tp)]
+    return vector.rates(
+        currencies,
+        [x.currency for x in trades],
+        [x.datetime.date() for x in trades],
+    )
 
-            currency_rate = currencies.get(
-                trade.currency, trade.datetime.date()
-            )
 
-            cost = abs(trade.t_price * q_order.quantity)
-            agg["buy"] += cost
+def rated_quantities(take_profit):
+    # quantities of rated_trades()
+    return [x.quantity for x in take_profit.buys] + [take_profit.quantity]
 
-            cost_rub = currency_rate * cost
-            agg["buy_rub"] += cost_rub
 
-            fee = abs(trade.comm_fee)
-            agg["fee"] += fee
+def to_kopecks(take_profits, rates):
+    # -> cost and fee in kopecks of every rated_trades() item, an amount is
+    # the exact price units times the quantity
+    trades = [x for tp in take_profits for x in rated_trades(tp)]
+    quantities = [q for tp in take_profits for q in rated_quantities(tp)]
 
-            fee_rub = currency_rate * fee
-            agg["fee_rub"] += fee_rub
+    rate_units = money.to_rate_units(rates)
+    prices = money.to_units([x.t_price for x in trades])
+    fees = money.to_units([abs(x.comm_fee) for x in trades])
 
-            yield [
-                # symbol
-                symbol,
-                # date
-                trade.datetime.strftime("%Y.%m.%d"),
-                # quantity
+    return (
+        money.convert(
+            [abs(p * q) for p, q in zip(prices, quantities)], rate_units
+        ),
+        money.convert(fees, rate_units),
+    )
+
+
+@dataclass
+class BuyResult:
+    trade: Trade
+    quantity: int
+    rate: float
+    cost: float
+    # kopecks
+    cost_rub: int
+    fee: float
+    fee_rub: int
+
+
+@dataclass
+class ProfitResult:
+    take_profit: TakeProfit
+    buys: List[BuyResult]
+    # of the sell, rub amounts are in kopecks
+    rate: float
+    proceeds: float
+    proceeds_rub: int
+    fee: float
+    fee_rub: int
+    # of the whole take profit, fees of the buys and the sell are deducted
+    pl_rub: int
+    tax_base_rub: int
+
+    @property
+    def symbol(self):
+        return self.take_profit.sell.symbol
+
+
+def to_result(take_profit, rates, costs_rub, fees_rub):
+    # of rated_trades(take_profit), every trade is converted to kopecks on
+    # its own and the sums are exact
+    buys = []
+    buy_rub = 0
+    fee_rub = 0
+
+    for q_order, currency_rate, cost_rub, fee in zip(
+        take_profit.buys, rates, costs_rub, fees_rub
+    ):
+        trade = q_order.trade
+        buy_rub += cost_rub
+        fee_rub += fee
+
+        buys.append(
+            BuyResult(
+                trade,
                 q_order.quantity,
-                # price
-                to_f4(trade.t_price),
-                # cost
-                to_f(-cost),
-                # currency
-                trade.currency,
-                # currency rate
-                to_f(currency_rate),
-                # cost in rub
-                to_f(-cost_rub),
-                # fee
-                to_f(-fee),
-                # fee in rub
-                to_f(-fee_rub),
-            ]
-
-        trade = take_profit.sell
-        currency_rate = currencies.get(trade.currency, trade.datetime.date())
-
-        fee = abs(trade.comm_fee)
-        agg["fee"] += fee
-
-        fee_rub = currency_rate * fee
-        agg["fee_rub"] += fee_rub
-
-        cost = abs(trade.t_price * trade.quantity)
-        cost_rub = currency_rate * cost
-        yield [
+                currency_rate,
+                abs(trade.t_price * q_order.quantity),
+                cost_rub,
+                abs(trade.comm_fee),
+                fee,
+            )
+        )
+
+    trade = take_profit.sell
+    i = len(take_profit.buys)
+    proceeds_rub = costs_rub[i]
+    fee_rub += fees_rub[i]
+
+    return ProfitResult(
+        take_profit,
+        buys,
+        rates[i],
+        abs(trade.t_price * take_profit.quantity),
+        proceeds_rub,
+        abs(trade.comm_fee),
+        fees_rub[i],
+        proceeds_rub - buy_rub,
+        proceeds_rub - buy_rub - fee_rub,
+    )
+
+
+def compute(currencies: CurrencyMap, take_profits):
+    rates = convert(currencies, take_profits)
+    costs_rub, fees_rub = to_kopecks(take_profits, rates)
+
+    results = []
+    start = 0
+    for take_profit in take_profits:
+        end = start + len(take_profit.buys) + 1
+        results.append(
+            to_result(
+                take_profit,
+                rates[start:end],
+                costs_rub[start:end],
+                fees_rub[start:end],
+            )
+        )
+        start = end
+
+    return results
+
+
+def format_rows(result: ProfitResult):
+    symbol = result.symbol
+
+    rows = [
+        [
+            # symbol
+            symbol,
+            # date
+            buy.trade.datetime.strftime("%Y.%m.%d"),
+            # quantity
+            buy.quantity,
+            # price
+            to_f4(buy.trade.t_price),
+            # cost
+            to_f(-buy.cost),
+            # currency
+            buy.trade.currency,
+            # currency rate
+            to_f(buy.rate),
+            # cost in rub
+            to_k(-buy.cost_rub),
+            # fee
+            to_f(-buy.fee),
+            # fee in rub
+            to_k(-buy.fee_rub),
+        ]
+        for buy in result.buys
+    ]
+
+    take_profit = result.take_profit
+    trade = take_profit.sell
+    rows.append(
+        [
             # symbol
             symbol,
             # date
             trade.datetime.strftime("%Y.%m.%d"),
             # quantity
-            -abs(trade.quantity),
+            -take_profit.quantity,
             # price
             to_f4(trade.t_price),
             # cost
-            to_f(cost),
+            to_f(result.proceeds),
             # currency
             trade.currency,
             # currency rate
-            to_f(currency_rate),
+            to_f(result.rate),
             # cost in rub
-            to_f(cost_rub),
+            to_k(result.proceeds_rub),
             # fee
-            to_f(-fee),
+            to_f(-result.fee),
             # fee in rub
-            to_f(-fee_rub),
+            to_k(-result.fee_rub),
             # pl
-            to_f(trade.realized_pl),
+            to_f(take_profit.realized_pl),
             # pl in rub
-            to_f(cost_rub - agg["buy_rub"]),
+            to_k(result.pl_rub),
             # tax baseline in rub
-            to_f(cost_rub - agg["buy_rub"] - agg["fee_rub"]),
+            to_k(result.tax_base_rub),
         ]
+    )
 
-    return list(walk())
+    return rows
 
 
-def take_profits(symb):
-    def walk():
-        buy_trades = [QuantityOrder(x.quantity, x) for x in symb.buy_trades()]
+def to_rows(currencies: CurrencyMap, take_profit, rates=None):
+    if rates is None:
+        rates = convert(currencies, [take_profit])
 
-        for sell in symb.sell_trades():
-            quantity = -sell.quantity
+    costs_rub, fees_rub = to_kopecks([take_profit], rates)
+    return format_rows(to_result(take_profit, rates, costs_rub, fees_rub))
 
-            buys = []
 
-            while buy_trades:
-                buy = buy_trades.pop(0)
+def take_profits(symb, position=None):
+    # position is left with the lots still open after the trades
+    position = Position() if position is None else position
+    # a snapshot has a single side of a symbol, nothing is matched here
+    for quantity, trade in symb.lots:
+        position.add(quantity, trade)
 
-                if buy.quantity == quantity:
-                    buys.append(QuantityOrder(quantity, buy.trade))
-                    break
+    def walk():
+        # statement order is chronological except for merged reports
+        trades = sorted(symb.trades, key=lambda x: x.datetime)
+
+        for trade in trades:
+            quantity = trade.quantity
+            if quantity > 0:
+                closed, _ = position.add(quantity, trade)
+                yield from covered(trade, closed)
+                continue
 
-                if buy.quantity > quantity:
-                    buys.append(QuantityOrder(quantity, buy.trade))
-                    extra = buy.quantity - quantity
-                    buy_trades.insert(0, QuantityOrder(extra, buy.trade))
-                    break
+            # only an opening sell is a short, a closing one without the
+            # buys is of a position opened before the statements
+            closed, left = position.add(quantity, trade, opens=is_open(trade))
+            if left:
+                logger.warning(
+                    "%s: no buys for %s of the sell on %s",
+                    symb.symbol,
+                    left,
+                    trade.datetime,
+                )
+                # the whole sell, the missing buys have no cost
+                yield TakeProfit(
+                    [QuantityOrder(q, buy) for q, buy in closed], trade
+                )
+            elif closed:
+                buys = [QuantityOrder(q, buy) for q, buy in closed]
+                yield TakeProfit(buys, trade, sum(q for q, _ in closed))
 
-                buys.append(QuantityOrder(buy.quantity, buy.trade))
-                quantity -= buy.quantity
+    return list(walk())
 
-            yield TakeProfit(buys, sell)
 
-    return list(walk())
+def is_open(trade):
+    # Code is ";" separated, O opens a position, C closes one
+    return "O" in trade.code.split(";")
 
 
-def show(w, currencies_map, report):
-    grouped = group_trades(Trade.parse(report))
-    for symb in grouped:
-        if not symb.has_realised():
-            continue
+def covered(buy, closed):
+    # a buy covering shorts, each short sale is a separate profit with its
+    # share of the buy realized p/l, the shares add up to it in cents
+    total = sum(q for q, _ in closed)
+    realized = 0.0
+    for i, (q, sell) in enumerate(closed):
+        if i == len(closed) - 1:
+            share = round(buy.realized_pl - realized, 2)
+        else:
+            share = round(buy.realized_pl * q / total, 2)
+            realized += share
+        yield TakeProfit([QuantityOrder(q, buy)], sell, q, buy, share)
 
-        for take_profit in take_profits(symb):
-            if take_profit.year != report.year:
-                continue
 
-            for row in to_rows(currencies_map, take_profit):
-                w.writerow(row)
+def symbol_profits(symb):
+    if not symb.has_realised():
+        return []
+    return take_profits(symb)
+
+
+def by_year(report):
+    # FIFO runs once over the whole history, profits go to the sell year
+    profits = defaultdict(list)
+
+    grouped = group_trades(*report_trades(report))
+    for symb in grouped:
+        for take_profit in symbol_profits(symb):
+            profits[take_profit.year].append(take_profit)
+            metrics.count("equities.take_profits")
+            metrics.count("equities.lots_matched", len(take_profit.buys))
+
+    return profits
+
+
+def pool_size(report, workers=None):
+    # processes worth starting for the csv of a report, 1 keeps the work in
+    # the process, the pool is forked and shares the trades and the rates
+    workers = workers or os.cpu_count() or 1
+    if (
+        workers == 1
+        or len(report.records(Trade)) < PARALLEL_TRADES
+        or "fork" not in multiprocessing.get_all_start_methods()
+    ):
+        return 1
+    return workers
+
+
+def balance(sizes, count):
+    # -> chunks of positions, the largest go first, each to the lightest
+    # chunk, the heaviest chunks are returned first so the pool starts on
+    # them
+    chunks = [[] for _ in range(count)]
+    weights = [(0, i) for i in range(count)]
+    for position in sorted(range(len(sizes)), key=lambda x: -sizes[x]):
+        weight, i = heapq.heappop(weights)
+        chunks[i].append(position)
+        heapq.heappush(weights, (weight + sizes[position], i))
+
+    weights.sort(reverse=True)
+    return [chunks[i] for _, i in weights if chunks[i]]
+
+
+def symbol_csv(currencies_map: CurrencyMap, symb, years):
+    # -> {year: csv text} of a symbol, what write() gives for compute(),
+    # take profits and lots matched for the metrics
+    profits = symbol_profits(symb)
+    found = [x for x in profits if x.year in years]
+
+    out = defaultdict(io.StringIO)
+    for result in compute(currencies_map, found):
+        csv.writer(out[result.take_profit.year]).writerows(format_rows(result))
+    texts = {year: x.getvalue() for year, x in out.items()}
+    return texts, len(profits), sum(len(x.buys) for x in profits)
+
+
+# what a forked pool works on, the workers inherit it instead of unpickling
+# the trades, that costs more than matching them
+_forked = {}
+_forked_lock = threading.Lock()
+
+
+def chunk_csv(chunk):
+    # in a worker, chunk is positions in the grouped symbols
+    currencies_map, grouped, years = _forked["args"]
+    return [symbol_csv(currencies_map, grouped[i], years) for i in chunk]
+
+
+def csv_by_year(currencies_map: CurrencyMap, report, years, workers=None):
+    # -> {year: csv text}, symbols are independent and computed in chunks on
+    # a pool, the text is in the symbol order either way
+    years = [str(x) for x in years]
+    grouped = group_trades(*report_trades(report))
+    size = pool_size(report, workers)
+
+    if size == 1 or len(grouped) < 2:
+        found = [symbol_csv(currencies_map, x, years) for x in grouped]
+    else:
+        chunks = balance(
+            [len(x.trades) for x in grouped], size * CHUNKS_PER_WORKER
+        )
+        metrics.count("equities.chunks", len(chunks))
+
+        found = [None] * len(grouped)
+        with _forked_lock:
+            _forked["args"] = currencies_map, grouped, years
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=size,
+                    mp_context=multiprocessing.get_context("fork"),
+                ) as pool:
+                    for chunk, part in zip(
+                        chunks, pool.map(chunk_csv, chunks)
+                    ):
+                        for position, computed in zip(chunk, part):
+                            found[position] = computed
+            finally:
+                _forked.clear()
+
+    # counted in the workers, as by_year() does
+    metrics.count("equities.take_profits", sum(x[1] for x in found))
+    metrics.count("equities.lots_matched", sum(x[2] for x in found))
+
+    return {
+        year: "".join(x[0][year] for x in found if year in x[0])
+        for year in years
+    }
+
+
+def write(w, results):
+    for result in results:
+        w.writerows(format_rows(result))
@@ -1,56 +1,84 @@
-from collections import namedtuple
-from datetime import datetime
+from dataclasses import dataclass
 
+from ibtax import money, vector
 from ibtax.currencies import CurrencyMap
-from ibtax.formatting import to_f
-
-
-class Fee(
-    namedtuple(
-        "Fee",
-        [
-            "fees",
-            "header",
-            "subtitle",
-            "raw_currency",
-            "raw_date",
-            "description",
-            "raw_amount",
-        ],
+from ibtax.formatting import to_f, to_k
+from ibtax.records import Record, group_by_year, to_date
+from ibtax.schema import register
+
+
+class Fee(Record):
+    __slots__ = ("subtitle", "currency", "date", "description", "value")
+
+    # Fees,Data,Subtitle,Currency,Date,Description,Amount
+    schema = register(
+        "fees",
+        ("subtitle", ("Subtitle", "Подзаголовок"), 2),
+        ("currency", ("Currency", "Валюта"), 3),
+        ("date", ("Date", "Дата"), 4),
+        ("description", ("Description", "Описание"), 5),
+        ("value", ("Amount", "Сумма"), 6),
     )
-):
-    @property
-    def currency(self):
-        return self.raw_currency.upper()
 
-    @property
-    def datetime(self):
-        return datetime.strptime(self.raw_date, "%Y-%m-%d")
+    def __init__(self, subtitle, currency, date, description, value):
+        self.subtitle = subtitle
+        self.currency = currency
+        self.date = date
+        self.description = description
+        self.value = value
 
     @property
     def amount(self):
-        return abs(float(self.raw_amount))
+        return abs(self.value)
+
+    @classmethod
+    def from_row(cls, values):
+        # values of the schema columns
+        subtitle, currency, date, description, value = values
+        return cls(
+            subtitle=subtitle,
+            currency=currency.upper(),
+            date=to_date(date),
+            description=description,
+            value=float(value),
+        )
+
+    @classmethod
+    def subscribe(cls, reader, consumer):
+        def consume(values):
+            if "total" not in values[0].lower():
+                consumer(cls.from_row(values))
+
+        reader.subscribe("fees", consume, schema=cls.schema)
 
     @classmethod
     def parse(cls, report):
-        def walk():
-            for row in report.rows:
-                if (
-                    row[0].lower() == "fees"
-                    and row[1].lower() == "data"
-                    and "total" not in row[2].lower()
-                ):
-                    yield cls(*row)
+        return list(report.records(cls))
 
-        return list(walk())
 
+@dataclass
+class FeeResult:
+    fee: Fee
+    rate: float
+    # kopecks
+    amount_rub: int
+
+
+def convert(currencies_map: CurrencyMap, fees):
+    # -> rates, amounts in kopecks
+    rates = vector.rates(
+        currencies_map,
+        [x.currency for x in fees],
+        [x.date for x in fees],
+    )
+    return rates, money.to_rub_many([x.amount for x in fees], rates)
 
-def to_row(currencies_map: CurrencyMap, fee):
-    currency_rate = currencies_map.get(fee.currency, fee.datetime.date())
 
+def format_row(result: FeeResult):
+    fee = result.fee
     return [
         # date
-        fee.datetime.strftime("%Y.%m.%d"),
+        fee.date.strftime("%Y.%m.%d"),
         # description
         fee.description,
         # amount usd
@@ -58,14 +86,30 @@ def to_row(currencies_map: CurrencyMap, fee):
         # currency
         fee.currency,
         # currency rate
-        to_f(currency_rate),
+        to_f(result.rate),
         # amount rub
-        to_f(currency_rate * fee.amount),
+        to_k(result.amount_rub),
+    ]
+
+
+def compute(currencies_map: CurrencyMap, fees):
+    return [
+        FeeResult(*values)
+        for values in zip(fees, *convert(currencies_map, fees))
     ]
 
 
-def show(w, currencies_map, report):
-    fees = Fee.parse(report)
+def to_rows(currencies_map: CurrencyMap, fees):
+    return [format_row(x) for x in compute(currencies_map, fees)]
+
+
+def to_row(currencies_map: CurrencyMap, fee):
+    return to_rows(currencies_map, [fee])[0]
+
+
+def by_year(report):
+    return group_by_year(Fee.parse(report), lambda x: x.date)
+
 
-    for fee in fees:
-        w.writerow(to_row(currencies_map, fee))
+def write(w, results):
+    w.writerows(format_row(x) for x in results)
@@ -8,3 +8,10 @@ def to_f4(v):
     if isinstance(v, float):
         return "{:.4f}".format(v).replace(".", ",")
     return str(v).replace(".", ",")
+
+
+def to_k(v):
+    # integer kopecks
+    if v >= 0:
+        return "%d,%02d" % divmod(v, 100)
+    return "-%d,%02d" % divmod(-v, 100)
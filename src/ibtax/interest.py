@@ -1,77 +1,121 @@
-from collections import namedtuple
-from datetime import datetime
+from dataclasses import dataclass
 
+from ibtax import money, vector
 from ibtax.currencies import CurrencyMap
-from ibtax.formatting import to_f
-
-
-class Interest(
-    namedtuple(
-        "Interest",
-        [
-            "fees",
-            "header",
-            "raw_currency",
-            "raw_date",
-            "description",
-            "raw_amount",
-        ],
+from ibtax.formatting import to_f, to_k
+from ibtax.records import Record, group_by_year, to_date
+from ibtax.schema import register
+
+
+class Interest(Record):
+    __slots__ = ("currency", "date", "description", "value")
+
+    # Interest,Data,Currency,Date,Description,Amount
+    schema = register(
+        "interest",
+        ("currency", ("Currency", "Валюта"), 2),
+        ("date", ("Date", "Дата"), 3),
+        ("description", ("Description", "Описание"), 4),
+        ("value", ("Amount", "Сумма"), 5),
     )
-):
-    @property
-    def currency(self):
-        return self.raw_currency.upper()
 
-    @property
-    def datetime(self):
-        return datetime.strptime(self.raw_date, "%Y-%m-%d")
+    def __init__(self, currency, date, description, value):
+        self.currency = currency
+        self.date = date
+        self.description = description
+        self.value = value
 
     @property
     def amount(self):
-        return abs(float(self.raw_amount))
+        return abs(self.value)
+
+    @classmethod
+    def from_row(cls, values):
+        # values of the schema columns
+        currency, date, description, value = values
+        return cls(
+            currency=currency.upper(),
+            date=to_date(date),
+            description=description,
+            value=float(value),
+        )
+
+    @classmethod
+    def subscribe(cls, reader, consumer):
+        def consume(values):
+            subtitle = values[0].lower()
+            if (
+                subtitle not in ("total", "всего")
+                and "total interest in usd" not in subtitle
+                and "total in usd" not in subtitle
+            ):
+                consumer(cls.from_row(values))
+
+        for name in ("interest", "процент"):
+            reader.subscribe(name, consume, schema=cls.schema)
 
     @classmethod
     def parse(cls, report):
-        def walk():
-            for row in report.rows:
-                if (
-                    row[0].lower() in ("interest", "процент")
-                    and row[1].lower() == "data"
-                    and row[2].lower() not in ("total", "всего")
-                    and "total interest in usd" not in row[2].lower()
-                    and "total in usd" not in row[2].lower()
-                ):
-                    yield cls(*row)
+        return list(report.records(cls))
+
 
-        return list(walk())
+@dataclass
+class InterestResult:
+    item: Interest
+    rate: float
+    # kopecks
+    amount_rub: int
+    tax_to_pay: int
 
 
-def to_row(currencies_map: CurrencyMap, fee):
-    if fee.currency == "RUB":
-        currency_rate = 1
-    else:
-        currency_rate = currencies_map.get(fee.currency, fee.datetime.date())
+def convert(currencies_map: CurrencyMap, items):
+    # -> rates, amounts and tax to pay in kopecks
+    rates = vector.rates(
+        currencies_map,
+        [x.currency for x in items],
+        [x.date for x in items],
+    )
+    amounts_rub = money.to_rub_many([x.amount for x in items], rates)
+
+    return rates, amounts_rub, money.to_pay(amounts_rub)
 
-    amount_rub = currency_rate * fee.amount
 
+def format_row(result: InterestResult):
+    item = result.item
     return [
         # date
-        fee.datetime.strftime("%Y.%m.%d"),
+        item.date.strftime("%Y.%m.%d"),
         # amount usd
-        to_f(fee.amount),
+        to_f(item.amount),
         # currency
-        fee.currency,
+        item.currency,
         # currency rate
-        to_f(currency_rate),
+        to_f(result.rate),
         # amount rub
-        to_f(amount_rub),
+        to_k(result.amount_rub),
         # tax to pay rub
-        to_f(max(0, 0.13 * amount_rub)),
+        to_k(result.tax_to_pay),
+    ]
+
+
+def compute(currencies_map: CurrencyMap, items):
+    return [
+        InterestResult(*values)
+        for values in zip(items, *convert(currencies_map, items))
     ]
 
 
-def show(w, currencies_map, report):
-    items = Interest.parse(report)
+def to_rows(currencies_map: CurrencyMap, items):
+    return [format_row(x) for x in compute(currencies_map, items)]
+
+
+def to_row(currencies_map: CurrencyMap, item):
+    return to_rows(currencies_map, [item])[0]
+
+
+def by_year(report):
+    return group_by_year(Interest.parse(report), lambda x: x.date)
+
 
-    for item in items:
-        w.writerow(to_row(currencies_map, item))
+def write(w, results):
+    w.writerows(format_row(x) for x in results)
@@ -1,65 +1,141 @@
 from dataclasses import dataclass
-from datetime import datetime
 
+from ibtax import money, vector
 from ibtax.currencies import CurrencyMap
-from ibtax.formatting import to_f
-
-
-@dataclass
-class LendInterest:
-    title: str
-    header: str
-    raw_currency: str
-    raw_value_date: str
-    symbol: str
-    raw_start_date: str
-    raw_quantity: str
-    raw_collateral_amount: str
-    raw_interest_rate_by_ib: str
-    raw_interest_paid_to_ib: str
-    raw_interest_rate_on_customer: str
-    raw_interest_paid_to_customer: str
-    code: str
+from ibtax.formatting import to_f, to_k
+from ibtax.records import Record, group_by_year, to_date, to_quantity
+from ibtax.schema import register
+
+
+class LendInterest(Record):
+    __slots__ = (
+        "currency",
+        "value_date",
+        "symbol",
+        "start_date",
+        "_quantity",
+        "amount",
+        "code",
+    )
+    fields = (
+        "currency",
+        "value_date",
+        "symbol",
+        "start_date",
+        "quantity",
+        "amount",
+        "code",
+    )
+
+    # ...,Data,Currency,Value Date,Symbol,Start Date,Quantity,
+    # Collateral Amount,Interest Rate Earned by IB,Interest Paid to IB,
+    # Interest Rate on Customer Collateral,Interest Paid to Customer,Code
+    schema = register(
+        "lends",
+        ("currency", ("Currency", "Валюта"), 2),
+        ("value_date", ("Value Date", "Дата валютирования"), 3),
+        ("symbol", ("Symbol", "Символ"), 4),
+        ("start_date", ("Start Date", "Дата начала"), 5),
+        ("quantity", ("Quantity", "Количество"), 6),
+        (
+            "amount",
+            ("Interest Paid to Customer", "Проценты, выплаченные клиенту"),
+            11,
+        ),
+        ("code", ("Code", "Код"), 12),
+    )
+
+    def __init__(
+        self, currency, value_date, symbol, start_date, quantity, amount, code
+    ):
+        self.currency = currency
+        self.value_date = value_date
+        self.symbol = symbol
+        self.start_date = start_date
+        # not used by the reports, converted on the first use
+        self._quantity = quantity
+        # interest paid to customer
+        self.amount = amount
+        self.code = code
 
     @property
-    def currency(self):
-        return self.raw_currency.upper()
+    def quantity(self):
+        value = self._quantity
+        if type(value) is str:
+            value = self._quantity = to_quantity(value)
+        return value
 
     @property
-    def datetime(self):
-        return datetime.strptime(self.raw_start_date, "%Y-%m-%d")
+    def date(self):
+        return self.start_date
 
-    @property
-    def quantity(self):
-        return int(self.raw_quantity)
+    @classmethod
+    def from_row(cls, values):
+        # values of the schema columns
+        (
+            currency,
+            value_date,
+            symbol,
+            start_date,
+            quantity,
+            amount,
+            code,
+        ) = values
+        return cls(
+            currency=currency.upper(),
+            value_date=to_date(value_date),
+            symbol=symbol,
+            start_date=to_date(start_date),
+            quantity=quantity,
+            amount=float(amount),
+            code=code,
+        )
 
-    @property
-    def amount(self):
-        return float(self.raw_interest_paid_to_customer)
+    @classmethod
+    def subscribe(cls, reader, consumer):
+        def consume(values):
+            if "total" not in values[0].lower():
+                consumer(cls.from_row(values))
+
+        reader.subscribe(
+            "ibkr managed securities lent interest details"
+            " (stock yield enhancement program)",
+            consume,
+            partial=True,
+            schema=cls.schema,
+        )
 
     @classmethod
     def parse(cls, report):
-        def walk():
-            for row in report.rows:
-                if (
-                    "ibkr managed securities lent interest details"
-                    " (stock yield enhancement program)" in row[0].lower()
-                    and row[1].lower() == "data"
-                    and "total" not in row[2].lower()
-                ):
-                    yield cls(*row)
+        return list(report.records(cls))
 
-        return list(walk())
 
+@dataclass
+class LendResult:
+    item: LendInterest
+    rate: float
+    # kopecks
+    amount_rub: int
+    tax_to_pay: int
 
-def to_row(currencies_map: CurrencyMap, item):
-    currency_rate = currencies_map.get(item.currency, item.datetime.date())
 
-    amount_rub = currency_rate * item.amount
+def convert(currencies_map: CurrencyMap, items):
+    # -> rates, amounts and tax to pay in kopecks
+    rates = vector.rates(
+        currencies_map,
+        [x.currency for x in items],
+        [x.date for x in items],
+    )
+    amounts_rub = money.to_rub_many([x.amount for x in items], rates)
+
+    return rates, amounts_rub, money.to_pay(amounts_rub)
 
+
+def format_row(result: LendResult):
+    item = result.item
     return [
         # date
-        item.datetime.strftime("%Y.%m.%d"),
+        item.date.strftime("%Y.%m.%d"),
         # symbol
         item.symbol,
         # amount usd
@@ -67,17 +143,33 @@ def to_row(currencies_map: CurrencyMap, item):
         # currency
         item.currency,
         # currency rate
-        to_f(currency_rate),
+        to_f(result.rate),
         # amount rub
-        to_f(amount_rub),
+        to_k(result.amount_rub),
         # tax to pay rub
-        to_f(max(0, 0.13 * amount_rub)),
+        to_k(result.tax_to_pay),
+    ]
+
+
+def compute(currencies_map: CurrencyMap, items):
+    return [
+        LendResult(*values)
+        for values in zip(items, *convert(currencies_map, items))
     ]
 
 
-def show(w, currencies_map, report):
-    items = LendInterest.parse(report)
+def to_rows(currencies_map: CurrencyMap, items):
+    return [format_row(x) for x in compute(currencies_map, items)]
+
+
+def to_row(currencies_map: CurrencyMap, item):
+    return to_rows(currencies_map, [item])[0]
+
+
+def by_year(report):
+    items = [x for x in LendInterest.parse(report) if x.amount > 0]
+    return group_by_year(items, lambda x: x.date)
+
 
-    for item in items:
-        if item.amount > 0:
-            w.writerow(to_row(currencies_map, item))
+def write(w, results):
+    w.writerows(format_row(x) for x in results)
@@ -0,0 +1,79 @@
+from collections import deque
+
+
+class Lot:
+    __slots__ = ("quantity", "item")
+
+    def __init__(self, quantity, item):
+        self.quantity = quantity
+        self.item = item
+
+    def __repr__(self):
+        return "Lot({}, {})".format(self.quantity, self.item)
+
+
+class OpenLots:
+    # lots in FIFO order, a partial take only shrinks the head lot
+    def __init__(self):
+        self._lots = deque()
+        self.quantity = 0
+
+    def __len__(self):
+        return len(self._lots)
+
+    def __iter__(self):
+        return iter(self._lots)
+
+    def add(self, quantity, item):
+        self._lots.append(Lot(quantity, item))
+        self.quantity += quantity
+
+    def take(self, quantity):
+        # -> [(quantity, item), ...] taken, quantity left unmatched
+        taken = []
+        lots = self._lots
+
+        while quantity and lots:
+            lot = lots[0]
+
+            if lot.quantity > quantity:
+                lot.quantity -= quantity
+                self.quantity -= quantity
+                taken.append((quantity, lot.item))
+                return taken, 0
+
+            lots.popleft()
+            self.quantity -= lot.quantity
+            quantity -= lot.quantity
+            taken.append((lot.quantity, lot.item))
+
+        return taken, quantity
+
+
+class Position:
+    # long and short lots of a single symbol, a trade first closes the
+    # opposite side and opens a new lot with whatever is left
+    def __init__(self):
+        self.longs = OpenLots()
+        self.shorts = OpenLots()
+
+    @property
+    def quantity(self):
+        return self.longs.quantity - self.shorts.quantity
+
+    def add(self, quantity, item, opens=True):
+        # -> [(quantity, item), ...] lots closed by this trade, quantity left
+        # unmatched, a trade that doesn't open a position leaves it instead
+        # of opening a lot
+        if quantity > 0:
+            closed, left = self.shorts.take(quantity)
+            if left and opens:
+                self.longs.add(left, item)
+                left = 0
+        else:
+            closed, left = self.longs.take(-quantity)
+            if left and opens:
+                self.shorts.add(left, item)
+                left = 0
+
+        return closed, left
@@ -1,94 +1,456 @@
 import argparse
-import csv
 import logging
 import pathlib
-import re
+import signal
 import sys
-from datetime import date
+import threading
+import time
 
-from ibtax import equities, dividends, fees, interest, lends
-from ibtax.cache import PickleCache
-from ibtax.currencies import CurrencyMap
+from ibtax import api, batch, bundles, equities, server, snapshot
+from ibtax.currencies import (
+    CurrencyMap,
+    OUT_OF_RANGE_ERROR,
+    OUT_OF_RANGE_POLICIES,
+)
+from ibtax.cache import StatementCache
+from ibtax.metrics import metrics, profiled
+from ibtax.ratetable import RateTable, open_currency_map, table_from_store
+from ibtax.render import write_year, write_years
+from ibtax.report import RECORD_TYPES, Report, cache_version
+from ibtax.store import RateStore
+from ibtax.transport import CBR_URL, HttpTransport
 
 cache_dir = pathlib.Path(__file__).parent.parent.parent
 
 
-class Report:
-    def __init__(self, path):
-        path = pathlib.Path(path)
-        with path.open() as f:
-            reader = csv.reader(f)
-            self.rows = [r for r in reader]
-
-        self.years = self._parse_years(self.rows)
-        # take the last one, report could be a merged set of reports
-        self.year = sorted(self.years)[-1]
-
-    @property
-    def period(self) -> (date, date):
-        start_year = self.years[0]
-        end_year = self.years[-1]
-        return date(int(start_year), 1, 1), date(int(end_year), 12, 31)
-
-    @staticmethod
-    def _parse_years(rows):
-        # Statement,Data,Period,"January 1, 2020 - December 31, 2020"
-        def walk():
-            for row in rows:
-                if (
-                    row[0].lower() == "statement"
-                    and row[2].lower() == "period"
-                ):
-                    val = row[3]
-                    m = re.match(r".+(\d\d\d\d).+(\d\d\d\d)", val)
-                    if not m:
-                        raise ValueError("can't find a report period year")
-                    y1, y2 = m.group(1), m.group(2)
-                    if y1 != y2:
-                        raise ValueError("can't find a report period year")
-                    yield y1
-
-        return sorted(walk())
-
-
-def header(title):
-    print("#" * 79)
-    print("# {}".format(title))
-    print("#" * 79)
+def parse_years(value):
+    years = [x.strip() for x in value.split(",") if x.strip()]
+    if not years or not all(x.isdigit() and len(x) == 4 for x in years):
+        raise argparse.ArgumentTypeError(f"invalid years {value}")
+    return sorted(set(years))
+
+
+def parse_year(value):
+    years = parse_years(value)
+    if len(years) > 1:
+        raise argparse.ArgumentTypeError(f"invalid year {value}")
+    return years[0]
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--year-report", help="year report")
+    parser.add_argument(
+        "--year-report",
+        nargs="+",
+        help="year report(s), paths or glob patterns",
+    )
+    years = parser.add_mutually_exclusive_group()
+    years.add_argument(
+        "--years",
+        type=parse_years,
+        help="comma separated years to report, e.g. 2019,2020, defaults to"
+        " the last year of the reports",
+    )
+    years.add_argument(
+        "--all-years",
+        action="store_true",
+        help="report every year covered by the reports",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=pathlib.Path,
+        help="write each year to <dir>/<year>.csv instead of the stdout",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="write stage timings and counters as json, - for the stderr",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write cProfile stats of the run",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="parse the reports again instead of using the parsed ones",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="processes used to parse reports and compute the equities of"
+        " large ones, defaults to the cpu count, 1 runs sequentially",
+    )
+    parser.add_argument(
+        "--rates-out-of-range",
+        choices=OUT_OF_RANGE_POLICIES,
+        default=OUT_OF_RANGE_ERROR,
+        help="fail or use the last known rate for dates after the loaded"
+        " rates, dates before them always fail",
+    )
+    parser.add_argument(
+        "--rates-url",
+        default=CBR_URL,
+        help="base url of the CBR rates service",
+    )
+    parser.add_argument(
+        "--rates-timeout",
+        type=float,
+        default=30.0,
+        help="seconds to wait for the rates service",
+    )
+    parser.add_argument(
+        "--rates-table",
+        metavar="PATH",
+        help="map the rates from a table, see `ibtax rates table`",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="use only the stored rates, see `ibtax rates import`",
+    )
+    parser.add_argument(
+        "--lots",
+        metavar="PATH",
+        help="start the equities from the lots open at a year end, see"
+        " `ibtax lots write`, the reports of the following years are enough",
+    )
+
+    commands = parser.add_subparsers(dest="command")
+
+    rates = commands.add_parser("rates", help="manage the stored rates")
+    rates_commands = rates.add_subparsers(dest="rates_command", required=True)
+
+    rates_import = rates_commands.add_parser(
+        "import", help="load CBR XML responses or a rates snapshot"
+    )
+    rates_import.add_argument("files", nargs="+")
+    rates_import.add_argument(
+        "--currency",
+        help="currency of the XML files without a known CBR id",
+    )
+
+    rates_export = rates_commands.add_parser(
+        "export", help="save the stored rates as a snapshot"
+    )
+    rates_export.add_argument("file")
+    rates_export.add_argument(
+        "--currency",
+        action="append",
+        help="currencies to export, all by default",
+    )
+
+    rates_table = rates_commands.add_parser(
+        "table",
+        help="write the stored rates as a table for --rates-table",
+    )
+    rates_table.add_argument("file")
+    rates_table.add_argument(
+        "--currency",
+        action="append",
+        help="currencies to write, all by default",
+    )
+
+    batch_parser = commands.add_parser(
+        "batch",
+        help="report every account found in a directory",
+        description="accounts are <dir>/<account>/*.csv or"
+        " <dir>/<account>_<from>_<to>.csv, the years options apply to"
+        " every account",
+    )
+    batch_parser.add_argument("directory", type=pathlib.Path)
+    batch_parser.add_argument(
+        "--out",
+        type=pathlib.Path,
+        default=pathlib.Path("ibtax-batch"),
+        help="where <account>.csv and summary.json are written",
+    )
+
+    lots = commands.add_parser(
+        "lots", help="year end snapshots of the open lots"
+    )
+    lots_commands = lots.add_subparsers(dest="lots_command", required=True)
+
+    lots_write = lots_commands.add_parser(
+        "write", help="save the lots open at the end of a year"
+    )
+    lots_write.add_argument("file")
+    lots_write.add_argument(
+        "year_report",
+        nargs="+",
+        metavar="report",
+        help="year report(s) up to the year, paths or glob patterns",
+    )
+    lots_write.add_argument(
+        "--year",
+        type=parse_year,
+        help="defaults to the last year of the reports",
+    )
+
+    lots_verify = lots_commands.add_parser(
+        "verify",
+        help="compare a snapshot with the lots recomputed of the reports",
+    )
+    lots_verify.add_argument("file")
+    lots_verify.add_argument(
+        "year_report",
+        nargs="+",
+        metavar="report",
+        help="year report(s) since the first year of the lots",
+    )
+
+    serve_parser = commands.add_parser(
+        "serve",
+        help="serve reports over a unix socket with the rates kept warm",
+    )
+    serve_parser.add_argument("--socket", required=True, type=pathlib.Path)
+    serve_parser.add_argument(
+        "--keep",
+        type=int,
+        default=64,
+        help="parsed statements kept in memory",
+    )
+
     args = parser.parse_args()
+    if args.command is None and not args.year_report:
+        parser.error("--year-report is required")
+    if args.lots is not None and args.command in ("batch", "serve"):
+        # lots are of a single account
+        parser.error(f"--lots can't be used with {args.command}")
     return args
 
 
+def run_rates(args, store):
+    if args.rates_command == "import":
+        for path in args.files:
+            imported = bundles.import_file(store, path, args.currency)
+            for currency, count in sorted(imported.items()):
+                print(f"{path}: {count} {currency} rates", file=sys.stderr)
+    elif args.rates_command == "export":
+        count = bundles.export_csv(store, args.file, args.currency)
+        print(f"{args.file}: {count} rates", file=sys.stderr)
+    elif args.rates_command == "table":
+        table = RateTable(table_from_store(store, args.file, args.currency))
+        currencies = ", ".join(table.currencies())
+        table.close()
+        print(f"{args.file}: {currencies}", file=sys.stderr)
+
+
 def main():
     logging.basicConfig()
 
     args = parse_args()
 
-    report = Report(args.year_report)
+    store = RateStore(cache_dir / ".rates.sqlite")
+
+    if args.command == "rates":
+        run_rates(args, store)
+        return
+
+    if args.metrics_json is not None:
+        metrics.enable()
+
+    failed = False
+    with profiled(args.profile):
+        if args.command == "batch":
+            failed = run_batch(args, store)
+        elif args.command == "serve":
+            run_server(args, store)
+        elif args.command == "lots":
+            failed = run_lots(args)
+        else:
+            run_report(args, store)
+
+    if args.metrics_json is not None:
+        metrics.write(args.metrics_json)
+
+    if failed:
+        sys.exit(1)
+
+
+def statements_cache(args):
+    # (path, version) of the parsed statements cache
+    if args.no_cache:
+        return None
+    return cache_dir / ".statements", cache_version()
+
+
+def load_report(args):
+    cache = statements_cache(args)
+    if cache is not None:
+        cache = StatementCache(*cache)
+
+    with metrics.stage("load"):
+        report = Report.load(
+            args.year_report, workers=args.workers, cache=cache
+        )
+
+    for title, rows in report.scanned.items():
+        metrics.count(f"rows.{title}", rows)
+    for record_type in RECORD_TYPES:
+        count = len(report.records(record_type))
+        metrics.count(f"records.{record_type.__name__}", count)
+
+    if args.lots is not None:
+        report = report.start_from(snapshot.read(args.lots))
+
+    return report
+
+
+def run_lots(args):
+    report = load_report(args)
+
+    if args.lots_command == "write":
+        with metrics.stage("lots"):
+            lots = snapshot.take(report, args.year)
+        snapshot.write(args.file, lots)
+        count = sum(len(x) for x in lots.lots.values())
+        print(
+            f"{args.file}: {count} lots of {len(lots.lots)} symbols at the"
+            f" end of {lots.year}",
+            file=sys.stderr,
+        )
+        return False
+
+    lots = snapshot.read(args.file)
+    with metrics.stage("lots"):
+        differences = snapshot.verify(lots, report)
+    for line in differences:
+        print(f"{args.file}: {line}", file=sys.stderr)
+    if not differences:
+        print(f"{args.file}: the lots of {lots.year} match", file=sys.stderr)
+    return bool(differences)
+
+
+def run_report(args, store):
+    report = load_report(args)
     period_start, period_end = report.period
 
-    cache = PickleCache(cache_dir)
+    transport = HttpTransport(args.rates_url, timeout=args.rates_timeout)
+
+    with metrics.stage("rates"):
+        if args.rates_table is not None:
+            currencies_map = open_currency_map(
+                args.rates_table, args.rates_out_of_range
+            )
+        else:
+            currencies_map = CurrencyMap.build(
+                store,
+                period_start,
+                period_end,
+                args.rates_out_of_range,
+                transport=transport,
+                currencies=report.currencies(),
+                offline=args.offline,
+            )
+
+    # the statements are parsed and matched once, then split by year
+    years = api.select_years(report, args.years, args.all_years)
+
+    # symbols of a large report are computed on a pool, straight to csv
+    texts = {}
+    sections = None
+    if equities.pool_size(report, args.workers) > 1:
+        with metrics.stage("pool.equities"):
+            texts["equities"] = equities.csv_by_year(
+                currencies_map, report, years, args.workers
+            )
+        sections = [x for x in api.SECTIONS if x not in texts]
+
+    result = api.compute(
+        report, currencies_map, years=years, sections=sections
+    )
+
+    transport.close()
+
+    if args.output_dir is not None:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        for year in years:
+            path = args.output_dir / f"{year}.csv"
+            with path.open("w", newline="") as f:
+                year_texts = {name: x[year] for name, x in texts.items()}
+                write_year(f, result[year], banner=False, texts=year_texts)
+            print(f"{path}: {year}", file=sys.stderr)
+    else:
+        write_years(sys.stdout, result, texts)
+
+
+def run_batch(args, store):
+    accounts = batch.discover(args.directory)
+    if not accounts:
+        print(f"no statements found in {args.directory}", file=sys.stderr)
+        return True
+
+    transport = HttpTransport(args.rates_url, timeout=args.rates_timeout)
+
+    def build_map(start, end, currencies):
+        if args.rates_table is not None:
+            return open_currency_map(args.rates_table, args.rates_out_of_range)
+        return CurrencyMap.build(
+            store,
+            start,
+            end,
+            args.rates_out_of_range,
+            transport=transport,
+            currencies=currencies,
+            offline=args.offline,
+        )
+
+    started = time.perf_counter()
+    try:
+        results = batch.run(
+            accounts,
+            args.out,
+            build_map,
+            years=args.years,
+            all_years=args.all_years,
+            workers=args.workers,
+            cache=statements_cache(args),
+            table=args.rates_table,
+        )
+    finally:
+        transport.close()
+    elapsed = time.perf_counter() - started
+
+    batch.write_summary(args.out / "summary.json", results, elapsed)
+    batch.print_summary(results, elapsed, file=sys.stderr)
 
-    currencies_map = CurrencyMap.build(cache, period_start, period_end)
+    return any(x.error for x in results)
 
-    w = csv.writer(sys.stdout)
 
-    header("equity")
-    equities.show(w, currencies_map, report)
+def run_server(args, store):
+    transport = HttpTransport(args.rates_url, timeout=args.rates_timeout)
 
-    header("dividends")
-    dividends.show(w, currencies_map, report)
+    def build_map(start, end, currencies):
+        if args.rates_table is not None:
+            return open_currency_map(args.rates_table, args.rates_out_of_range)
+        return CurrencyMap.build(
+            store,
+            start,
+            end,
+            args.rates_out_of_range,
+            transport=transport,
+            currencies=currencies,
+            offline=args.offline,
+        )
 
-    header("fees")
-    fees.show(w, currencies_map, report)
+    cache = statements_cache(args)
+    if cache is not None:
+        cache = StatementCache(*cache)
 
-    header("interest")
-    interest.show(w, currencies_map, report)
+    state = server.State(build_map, cache=cache, keep=args.keep)
+    with server.Server(args.socket, state) as srv:
+        # shutdown() waits for serve_forever() so it can't run on this thread
+        signal.signal(
+            signal.SIGTERM,
+            lambda *_: threading.Thread(target=srv.shutdown).start(),
+        )
+        print(f"serving on {args.socket}", file=sys.stderr)
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
-    header("lend interest")
-    lends.show(w, currencies_map, report)
+    transport.close()
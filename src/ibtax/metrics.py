@@ -0,0 +1,124 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def cpu_time():
+    # including the finished worker processes
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def peak_rss(who="self"):
+    # bytes, ru_maxrss is in kilobytes on linux and in bytes on macos
+    if resource is None:
+        return None
+
+    if who == "self":
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+    else:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    if sys.platform == "darwin":
+        return usage.ru_maxrss
+    return usage.ru_maxrss * 1024
+
+
+class Metrics:
+    # stage timings and counters of a run, nothing is recorded until enabled
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.counters = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    @contextmanager
+    def stage(self, name):
+        # a repeated stage adds up, e.g. a section written for several years
+        if not self.enabled:
+            yield
+            return
+
+        wall, cpu = time.perf_counter(), cpu_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(
+                name, dict(wall=0.0, cpu=0.0, calls=0)
+            )
+            stage["wall"] += time.perf_counter() - wall
+            stage["cpu"] += cpu_time() - cpu
+            stage["calls"] += 1
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            with self._lock:
+                self.latencies[name].append(seconds)
+
+    def to_dict(self):
+        latencies = {}
+        for name, values in self.latencies.items():
+            values = sorted(values)
+            latencies[name] = dict(
+                count=len(values),
+                total=sum(values),
+                mean=sum(values) / len(values),
+                p50=values[len(values) // 2],
+                max=values[-1],
+            )
+
+        return dict(
+            stages=self.stages,
+            counters=dict(sorted(self.counters.items())),
+            latencies=latencies,
+            peak_rss=peak_rss(),
+            peak_rss_workers=peak_rss("children"),
+        )
+
+    def write(self, path):
+        # "-" is the stderr
+        if path == "-":
+            json.dump(self.to_dict(), sys.stderr, indent=2, ensure_ascii=False)
+            sys.stderr.write("\n")
+            return
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def profiled(path):
+    # cProfile stats for `python -m pstats` or snakeviz
+    if path is None:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,97 @@
+from itertools import repeat
+from operator import mul
+from typing import Sequence
+
+from ibtax import vector
+
+# amounts in a statement currency and prices are held as integer units of
+# 1e-6, that keeps the sub cent commissions IB reports, rates as integer
+# units of 1e-8 rub, exact for the CBR values divided by their nominals
+UNITS = 10**6
+RATE_UNITS = 10**8
+
+# rub amounts are integer kopecks
+KOPECKS = 100
+
+TAX_PERCENT = 13
+
+# amount units * rate units -> kopecks
+_DIVISOR = UNITS * RATE_UNITS // KOPECKS
+_HALF = _DIVISOR // 2
+# the rates are split by it to convert in int64, see vector.convert()
+_SPLIT = 10**5
+
+
+def to_units(amounts: Sequence):
+    # statement values have less decimals than the units, only the float
+    # representation error is dropped
+    return vector.scale(amounts, UNITS)
+
+
+def to_rate_units(rates: Sequence):
+    return vector.scale(rates, RATE_UNITS)
+
+
+def convert(units: Sequence, rate_units: Sequence):
+    # -> kopecks, every amount is converted on its own day and rounded half
+    # away from zero
+    if vector.np is not None:
+        found = vector.convert(units, rate_units, _DIVISOR, _SPLIT)
+        if found is not None:
+            return found
+
+    half = _HALF
+    divisor = _DIVISOR
+    return [
+        (p + half) // divisor if p >= 0 else -((half - p) // divisor)
+        for p in map(mul, units, rate_units)
+    ]
+
+
+def convert_amounts(amounts: Sequence, rate_units: Sequence):
+    # -> kopecks of the float amounts, convert(to_units(amounts), ...) in a
+    # single pass without numpy
+    if vector.np is not None:
+        found = vector.convert_scaled(
+            amounts, UNITS, rate_units, _DIVISOR, _SPLIT
+        )
+        if found is not None:
+            return found
+        return convert(to_units(amounts), rate_units)
+
+    half = _HALF
+    divisor = _DIVISOR
+    units = map(round, map(mul, amounts, repeat(UNITS)))
+    return [
+        (p + half) // divisor if p >= 0 else -((half - p) // divisor)
+        for p in map(mul, units, rate_units)
+    ]
+
+
+def to_rub_many(amounts: Sequence, rates: Sequence):
+    # -> kopecks of the float amounts at the float rates, convert_amounts()
+    # when the rates are shared by several amounts
+    return convert_amounts(amounts, to_rate_units(rates))
+
+
+def tax(kopecks: int) -> int:
+    # 13% of a tax base, rounded to kopecks half up
+    if kopecks <= 0:
+        return 0
+    return (kopecks * TAX_PERCENT + 50) // 100
+
+
+def to_pay(amounts_rub: Sequence, paid_rub: Sequence = None):
+    # tax due in kopecks as tax(), what was withheld abroad is credited
+    if vector.np is not None:
+        return vector.tax_due(amounts_rub, TAX_PERCENT, paid_rub)
+
+    # tax() inlined, a call per item is most of the time
+    percent = TAX_PERCENT
+    if paid_rub is None:
+        return [(a * percent + 50) // 100 if a > 0 else 0 for a in amounts_rub]
+    due = [
+        (a * percent + 50) // 100 - p if a > 0 else 0
+        for a, p in zip(amounts_rub, paid_rub)
+    ]
+    return [x if x > 0 else 0 for x in due]
@@ -0,0 +1,128 @@
+import mmap
+import os
+import pathlib
+import struct
+import sys
+from array import array
+from datetime import date
+from typing import Dict
+
+from ibtax.currencies import (
+    OUT_OF_RANGE_ERROR,
+    CurrencyMap,
+    RateNotFound,
+    RateSeries,
+)
+
+# magic, version, byte order of the values (0 little, 1 big), reserved,
+# number of currencies
+HEADER = struct.Struct("<4sHBBQ")
+# currency code, base day ordinal, offset of the values, number of values
+ENTRY = struct.Struct("<8sqQQ")
+
+MAGIC = b"IBRT"
+VERSION = 1
+
+BYTE_ORDERS = ("little", "big")
+
+
+def write_table(path, series: Dict[str, RateSeries]):
+    # float64 values are contiguous and 8 bytes aligned, the file is
+    # replaced at once so a mapped table is never seen half written
+    path = pathlib.Path(path)
+    names = sorted(series)
+
+    offset = HEADER.size + ENTRY.size * len(names)
+    entries = []
+    for name in names:
+        code = name.encode("ascii")
+        if len(code) > 8:
+            raise ValueError(f"currency code {name} is too long")
+        values = series[name].values
+        entries.append(
+            ENTRY.pack(code, series[name].base, offset, len(values))
+        )
+        offset += len(values) * 8
+
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        order = BYTE_ORDERS.index(sys.byteorder)
+        f.write(HEADER.pack(MAGIC, VERSION, order, 0, len(names)))
+        for entry in entries:
+            f.write(entry)
+        for name in names:
+            f.write(array("d", series[name].values).tobytes())
+    os.replace(tmp, path)
+
+    return path
+
+
+def table_from_store(store, path, currencies=None):
+    # everything held, from the first to the last stored day
+    series = {}
+    for name in currencies or store.currencies():
+        intervals = store.intervals(name)
+        if not intervals:
+            raise RateNotFound(f"no rates stored for {name}")
+        start = date.fromordinal(intervals[0][0])
+        end = date.fromordinal(intervals[-1][1])
+        series[name] = store.read(name, start, end)
+
+    return write_table(path, series)
+
+
+class RateTable:
+    # a table written by write_table, the series read the mapped pages
+    # directly so every process mapping the file shares them
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, order, _, count = HEADER.unpack_from(self._view)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a rates table")
+        if BYTE_ORDERS[order] != sys.byteorder:
+            self.close()
+            order = BYTE_ORDERS[order]
+            raise ValueError(f"{path} is written on a {order} endian host")
+
+        self.series = {}
+        for i in range(count):
+            code, base, offset, size = ENTRY.unpack_from(
+                self._view, HEADER.size + ENTRY.size * i
+            )
+            end = offset + size * 8
+            values = self._view[offset:end].cast("d")
+            self.series[code.rstrip(b"\0").decode("ascii")] = RateSeries(
+                base, values
+            )
+
+    def __getitem__(self, name) -> RateSeries:
+        try:
+            return self.series[name]
+        except KeyError:
+            raise RateNotFound(f"no {name} rates in {self.path}") from None
+
+    def currencies(self):
+        return sorted(self.series)
+
+    def close(self):
+        # the views have to go before the map
+        for series in getattr(self, "series", {}).values():
+            series.values.release()
+        self.series = {}
+        self._view.release()
+        self._mmap.close()
+
+
+def open_currency_map(path, out_of_range=OUT_OF_RANGE_ERROR, self_cur="RUB"):
+    # the map reads the table pages, nothing is copied or loaded lazily
+    table = RateTable(path)
+    currencies_map = CurrencyMap(self_cur, out_of_range)
+    for name, series in table.series.items():
+        currencies_map.add(name, series)
+    return currencies_map
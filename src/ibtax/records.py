@@ -0,0 +1,101 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Record:
+    # typed statement record, values are converted once when a row is read
+    __slots__ = ()
+
+    # the constructor arguments, the same as the slots unless a value is
+    # kept raw in a private slot and converted on the first use
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "fields" not in cls.__dict__:
+            cls.fields = cls.__slots__
+
+    def __repr__(self):
+        values = ", ".join(
+            "{}={!r}".format(name, getattr(self, name)) for name in self.fields
+        )
+        return "{}({})".format(type(self).__name__, values)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.fields
+        )
+
+    def astuple(self):
+        # the constructor takes the values in the same order, the raw ones
+        # are passed on as they are
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        # much smaller and faster to pickle than the slots state
+        return type(self), self.astuple()
+
+    def replace(self, **changes):
+        values = dict(zip(self.fields, self.astuple()))
+        values.update(changes)
+        return type(self)(**values)
+
+
+# statements repeat the same few hundred dates over and over
+@lru_cache(maxsize=4096)
+def to_date(value):
+    # 2020-01-31
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def to_datetime(value):
+    # 2020-01-31, 10:00:00
+    if len(value) == 20:
+        return datetime(
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[12:14]),
+            int(value[15:17]),
+            int(value[18:20]),
+        )
+    return datetime.strptime(value, "%Y-%m-%d, %H:%M:%S")
+
+
+def to_float(value):
+    return float(value) if value else 0.0
+
+
+def to_quantity(value):
+    # rows of some assets, forex, have thousands separators, "-1,500", and
+    # splits may contain non integer values
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    value = value.replace(",", "")
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning("unexpected quantity %r", value)
+        return int(float(value))
+
+
+def to_price(value):
+    return float(value.replace(",", ""))
+
+
+def group_by_year(items, get_date):
+    # {"2020": [...], ...}
+    groups = defaultdict(list)
+    for item in items:
+        groups[str(get_date(item).year)].append(item)
+    return groups
@@ -0,0 +1,40 @@
+import csv
+
+from ibtax import api
+from ibtax.metrics import metrics
+
+# title, YearResult field
+SECTIONS = (
+    ("equity", "equities"),
+    ("dividends", "dividends"),
+    ("fees", "fees"),
+    ("interest", "interest"),
+    ("lend interest", "lends"),
+)
+
+
+def header(title, file=None):
+    print("#" * 79, file=file)
+    print("# {}".format(title), file=file)
+    print("#" * 79, file=file)
+
+
+def write_year(out, result, banner, texts=None):
+    # texts, {YearResult field: csv text} of the sections written elsewhere
+    w = csv.writer(out)
+    for title, name in SECTIONS:
+        header(f"{result.year} {title}" if banner else title, file=out)
+        with metrics.stage(f"write.{name}"):
+            if texts and name in texts:
+                out.write(texts[name])
+            else:
+                api.SECTIONS[name].write(w, getattr(result, name))
+
+
+def write_years(out, result: api.Result, texts=None):
+    # a banner per year when there are several, texts are
+    # {YearResult field: {year: csv text}}
+    banner = len(result.years) > 1
+    for year, year_result in result.years.items():
+        year_texts = {name: x[year] for name, x in (texts or {}).items()}
+        write_year(out, year_result, banner, year_texts)
@@ -0,0 +1,251 @@
+import glob
+import hashlib
+import io
+import logging
+import pathlib
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from ibtax import equities, dividends, fees, interest, lends
+from ibtax import schema
+from ibtax.metrics import metrics
+from ibtax.statement import StatementReader
+
+logger = logging.getLogger(__name__)
+
+RECORD_TYPES = (
+    equities.Trade,
+    dividends.Payout,
+    dividends.Withhold,
+    fees.Fee,
+    interest.Interest,
+    lends.LendInterest,
+)
+
+# bump when the parsing changes, the cached statements are parsed again
+CACHE_FORMAT = 2
+
+# Statement,Data,Field Name,Field Value
+STATEMENT = schema.register(
+    "statement",
+    ("name", ("Field Name", "Имя поля"), 2),
+    ("value", ("Field Value", "Значение поля"), 3),
+)
+
+
+def cache_version(record_types=RECORD_TYPES):
+    # the schemas too, the columns could be read differently
+    signature = ";".join(
+        "{}.{}({})".format(x.__module__, x.__name__, ",".join(x.__slots__))
+        for x in record_types
+    )
+    signature = f"{CACHE_FORMAT}:{signature}:{schema.signature()}".encode()
+    return hashlib.sha256(signature).hexdigest()[:16]
+
+
+def expand_paths(values):
+    paths = []
+    for value in values:
+        if isinstance(value, str) and glob.has_magic(value):
+            matched = sorted(glob.glob(value))
+            if not matched:
+                raise ValueError(f"no reports match {value}")
+            paths.extend(matched)
+        else:
+            paths.append(value)
+
+    # a path given twice, or matched by several patterns, is read once
+    found = {}
+    for path in map(pathlib.Path, paths):
+        found.setdefault(path.resolve(), path)
+    return list(found.values())
+
+
+class Report:
+    def __init__(self, years, records, scanned=None, lots=None):
+        self.years = sorted(years)
+        self._records = records
+        # section title -> data rows read, empty for a cached report
+        self.scanned = scanned or {}
+        # take the last one, report could be a merged set of reports
+        self.year = self.years[-1]
+        # a snapshot of the lots open before the reports, see start_from()
+        self.lots = lots
+
+    def records(self, record_type):
+        return self._records[record_type]
+
+    def currencies(self):
+        found = {
+            item.currency
+            for items in self._records.values()
+            for item in items
+            if item.currency
+        }
+        if self.lots is not None:
+            found |= self.lots.currencies()
+        return found
+
+    @property
+    def period(self) -> (date, date):
+        start_year = self.years[0]
+        end_year = self.years[-1]
+        start = date(int(start_year), 1, 1)
+        # the open lots are converted on the days they were bought
+        if self.lots is not None and self.lots.start() is not None:
+            start = min(start, self.lots.start())
+        return start, date(int(end_year), 12, 31)
+
+    def start_from(self, lots):
+        # -> the report starting from the lots open at a year end, trades up
+        # to that year end are left to the lots
+        if lots.year >= self.year:
+            raise ValueError(
+                f"lots of {lots.year} are not older than the reports"
+                f" up to {self.year}"
+            )
+        if int(self.years[0]) > int(lots.year) + 1:
+            logger.warning(
+                "no reports between the lots of %s and %s, the trades of"
+                " the years between are missing",
+                lots.year,
+                self.years[0],
+            )
+        return Report(self.years, self._records, self.scanned, lots)
+
+    @classmethod
+    def read(cls, path, record_types=RECORD_TYPES):
+        path = pathlib.Path(path)
+        with path.open() as f:
+            return cls.parse(f, path, record_types)
+
+    @classmethod
+    def read_bytes(
+        cls, data: bytes, name="<bytes>", record_types=RECORD_TYPES
+    ):
+        # an uploaded statement
+        text = io.StringIO(data.decode("utf-8-sig"), newline="")
+        return cls.parse(text, name, record_types)
+
+    @classmethod
+    def parse(cls, lines, name, record_types=RECORD_TYPES):
+        years = []
+        records = {}
+
+        def consume_statement(values):
+            # Statement,Data,Period,"January 1, 2020 - December 31, 2020"
+            title, value = values
+            if title.lower() == "period":
+                year = cls._parse_year(value)
+                # statements concatenated into one file, as merge() checks
+                if year in years:
+                    raise ValueError(f"{name} covers {year} twice")
+                years.append(year)
+
+        reader = StatementReader()
+        reader.subscribe("statement", consume_statement, schema=STATEMENT)
+        for record_type in record_types:
+            items = records[record_type] = []
+            record_type.subscribe(reader, items.append)
+        reader.read_lines(lines)
+
+        if not years:
+            raise ValueError(f"can't find a report period in {name}")
+
+        scanned = {}
+        for (title, kind), rows in reader.rows.items():
+            if kind.lower() == "data":
+                title = title.lower()
+                scanned[title] = scanned.get(title, 0) + rows
+
+        return cls(years, records, scanned)
+
+    def dump(self):
+        # plain tuples are smaller and load faster than pickled records
+        return self.years, {
+            record_type.__name__: [x.astuple() for x in items]
+            for record_type, items in self._records.items()
+        }
+
+    @classmethod
+    def restore(cls, state, record_types=RECORD_TYPES):
+        years, values = state
+        records = {
+            record_type: [
+                record_type(*x) for x in values[record_type.__name__]
+            ]
+            for record_type in record_types
+        }
+        return cls(years, records)
+
+    @classmethod
+    def merge(cls, reports, names=None):
+        # sections are concatenated in statement period order, FIFO matching
+        # relies on the trades being chronological
+        names = names or [f"report {i + 1}" for i in range(len(reports))]
+
+        # a year in several reports, e.g. a merged report along with the
+        # yearly ones, would count its records twice
+        covered = {}
+        for report, name in zip(reports, names):
+            for year in sorted(set(report.years)):
+                if year in covered:
+                    raise ValueError(
+                        f"{covered[year]} and {name} both cover {year}"
+                    )
+                covered[year] = name
+
+        reports = sorted(reports, key=lambda x: x.years)
+
+        years = []
+        records = {}
+        scanned = {}
+        for report in reports:
+            years.extend(report.years)
+            for record_type, items in report._records.items():
+                records.setdefault(record_type, []).extend(items)
+            for title, rows in report.scanned.items():
+                scanned[title] = scanned.get(title, 0) + rows
+
+        return cls(years, records, scanned)
+
+    @classmethod
+    def load(cls, values, workers=None, cache=None):
+        paths = expand_paths(values)
+
+        reports = {}
+        if cache is not None:
+            for path in paths:
+                state = cache.get(path)
+                if state is not None:
+                    reports[path] = cls.restore(state)
+
+        # only new or changed statements are parsed
+        missing = [x for x in paths if x not in reports]
+        if len(missing) == 1 or workers == 1:
+            reports.update((x, cls.read(x)) for x in missing)
+        elif missing:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                reports.update(zip(missing, pool.map(cls.read, missing)))
+
+        if cache is not None:
+            for path in missing:
+                cache.set(path, reports[path].dump())
+
+        metrics.count("statements.cached", len(paths) - len(missing))
+        metrics.count("statements.parsed", len(missing))
+
+        if len(paths) == 1:
+            return reports[paths[0]]
+        return cls.merge([reports[x] for x in paths], paths)
+
+    @staticmethod
+    def _parse_year(val):
+        m = re.match(r".+(\d\d\d\d).+(\d\d\d\d)", val)
+        if not m:
+            raise ValueError("can't find a report period year")
+        y1, y2 = m.group(1), m.group(2)
+        if y1 != y2:
+            raise ValueError("can't find a report period year")
+        return y1
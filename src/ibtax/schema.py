@@ -0,0 +1,99 @@
+import logging
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+
+class Column:
+    # a value read from a section, found by the header titles it has in the
+    # english and the russian statements, position is where it is in the
+    # statements without a header
+    __slots__ = ("field", "titles", "position")
+
+    def __init__(self, field, titles, position):
+        self.field = field
+        self.titles = tuple(x.lower() for x in titles)
+        self.position = position
+
+    def __repr__(self):
+        return "Column({!r}, {!r}, {})".format(
+            self.field, self.titles, self.position
+        )
+
+
+class Schema:
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = tuple(columns)
+        self.fields = tuple(x.field for x in self.columns)
+        # warned once per header layout
+        self._warned = set()
+
+    def signature(self):
+        return "{}({})".format(
+            self.name,
+            ",".join(
+                "{}:{}:{}".format(x.field, "|".join(x.titles), x.position)
+                for x in self.columns
+            ),
+        )
+
+    def positions(self, header=None):
+        # -> position of every column in the rows under the header
+        if header is None:
+            return [x.position for x in self.columns]
+
+        index = {}
+        for i, title in enumerate(header):
+            index.setdefault(title.strip().lower(), i)
+
+        positions = []
+        missing = []
+        for column in self.columns:
+            for title in column.titles:
+                if title in index:
+                    positions.append(index[title])
+                    break
+            else:
+                positions.append(column.position)
+                missing.append(column.titles[0])
+
+        if missing and tuple(header) not in self._warned:
+            self._warned.add(tuple(header))
+            logger.warning(
+                "%s: no %s in the header, read by position",
+                self.name,
+                ", ".join(missing),
+            )
+        return positions
+
+    def projection(self, header=None):
+        # -> row -> tuple of the column values in the schema order, short
+        # rows are padded with empty values
+        positions = self.positions(header)
+        width = max(positions) + 1
+        get = itemgetter(*positions)
+        if len(positions) == 1:
+            get = lambda row, get=get: (get(row),)  # noqa: E731
+
+        def project(row):
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            return get(row)
+
+        return project
+
+
+# name -> schema of every section read
+SCHEMAS = {}
+
+
+def register(name, *columns):
+    # columns are (field, titles, position)
+    schema = SCHEMAS[name] = Schema(name, [Column(*x) for x in columns])
+    return schema
+
+
+def signature():
+    # changes whenever a schema does, part of the cache version
+    return ";".join(SCHEMAS[x].signature() for x in sorted(SCHEMAS))
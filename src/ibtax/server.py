@@ -0,0 +1,288 @@
+import dataclasses
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date, datetime
+
+from ibtax import api
+from ibtax.metrics import metrics
+from ibtax.records import Record
+from ibtax.render import write_years
+from ibtax.report import Report
+
+logger = logging.getLogger(__name__)
+
+# a request and a response are a json header line and a body of the size
+# given in the header
+#
+# -> {"paths": ["2020.csv"], "years": ["2020"], "format": "csv"}
+# -> {"uploads": [1024], "all_years": true, "format": "json"} + 1024 bytes
+# <- {"ok": true, "size": 2048, "seconds": 0.01} + 2048 bytes
+# <- {"ok": false, "error": "...", "size": 0}
+FORMATS = ("csv", "json")
+
+MAX_HEADER = 64 * 1024
+# of an uploaded statement
+MAX_UPLOAD = 64 * 1024 * 1024
+
+
+class RequestError(Exception):
+    pass
+
+
+def to_json(value):
+    # json.dumps default for the section results
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Record):
+        return {name: getattr(value, name) for name in value.fields}
+    if dataclasses.is_dataclass(value):
+        return {
+            x.name: getattr(value, x.name) for x in dataclasses.fields(value)
+        }
+    if hasattr(value, "__dict__"):
+        return vars(value)
+    raise TypeError(f"{type(value).__name__} is not serializable")
+
+
+def render(result: api.Result, fmt):
+    if fmt == "json":
+        years = {
+            year: {name: getattr(year_result, name) for name in api.SECTIONS}
+            for year, year_result in result.years.items()
+        }
+        return json.dumps(dict(years=years), default=to_json).encode()
+
+    out = io.StringIO()
+    write_years(out, result)
+    return out.getvalue().encode()
+
+
+class State:
+    # what stays warm between the requests: the currency map of every
+    # period seen so far and the recently parsed statements
+    def __init__(self, build_map, cache=None, keep=64):
+        # build_map(start, end, currencies) -> CurrencyMap
+        self.build_map = build_map
+        self.cache = cache
+        self.keep = keep
+        # period -> future of the currency map
+        self._maps = {}
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+        self._maps_lock = threading.Lock()
+
+    def _remember(self, key, load):
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+                metrics.count("serve.reports_warm")
+                return report
+
+        report = load()
+        metrics.count("serve.reports_parsed")
+
+        with self._lock:
+            self._reports[key] = report
+            while len(self._reports) > self.keep:
+                self._reports.popitem(last=False)
+        return report
+
+    def report(self, paths=(), uploads=()):
+        reports = []
+        for path in paths:
+            path = pathlib.Path(path).resolve()
+            stat = path.stat()
+            key = (str(path), stat.st_size, stat.st_mtime_ns)
+            reports.append(
+                self._remember(
+                    key,
+                    lambda: Report.load([path], workers=1, cache=self.cache),
+                )
+            )
+        for i, data in enumerate(uploads):
+            key = hashlib.sha256(data).hexdigest()
+            name = f"<upload {i}>"
+            reports.append(
+                self._remember(key, lambda: Report.read_bytes(data, name))
+            )
+
+        if not reports:
+            raise RequestError("no statements in the request")
+        if len(reports) == 1:
+            return reports[0]
+        return Report.merge(reports)
+
+    def currency_map(self, report):
+        # one per period, currencies missing from it are loaded lazily, only
+        # the requests of a period being built wait for it
+        period = report.period
+        with self._maps_lock:
+            future = self._maps.get(period)
+            building = future is None
+            if building:
+                future = self._maps[period] = Future()
+
+        if building:
+            try:
+                future.set_result(self.build_map(*period, report.currencies()))
+            except Exception as e:
+                # the next request of the period tries again
+                with self._maps_lock:
+                    del self._maps[period]
+                future.set_exception(e)
+        return future.result()
+
+    def handle(self, header, uploads):
+        fmt = header.get("format", "csv")
+        if fmt not in FORMATS:
+            raise RequestError(f"unknown format {fmt}")
+
+        report = self.report(header.get("paths", ()), uploads)
+        years = api.select_years(
+            report, header.get("years"), header.get("all_years", False)
+        )
+        result = api.compute(report, self.currency_map(report), years=years)
+        return render(result, fmt)
+
+
+def read_message(f):
+    # -> header, uploads, None at the end of the stream
+    line = f.readline(MAX_HEADER)
+    if not line:
+        return None, None
+    if not line.endswith(b"\n"):
+        raise RequestError("request header is too long")
+
+    try:
+        header = json.loads(line)
+    except ValueError as e:
+        raise RequestError(f"bad request header: {e}") from None
+    if not isinstance(header, dict):
+        raise RequestError("request header is not an object")
+
+    sizes = header.get("uploads", [])
+    if not isinstance(sizes, list):
+        raise RequestError("uploads is not a list of sizes")
+    for size in sizes:
+        if type(size) is not int or not 0 <= size <= MAX_UPLOAD:
+            raise RequestError(
+                f"bad upload size {size!r}, at most {MAX_UPLOAD} bytes"
+            )
+
+    uploads = []
+    for size in sizes:
+        data = f.read(size)
+        if len(data) != size:
+            raise RequestError("request body is cut short")
+        uploads.append(data)
+
+    return header, uploads
+
+
+def write_message(f, header, body=b""):
+    # at once, the client could close as soon as it has read the response
+    header = dict(header, size=len(body))
+    f.write(json.dumps(header).encode() + b"\n" + body)
+    f.flush()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            self.serve()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away
+            pass
+
+    def serve(self):
+        # several requests could come over one connection
+        while True:
+            try:
+                header, uploads = read_message(self.rfile)
+            except RequestError as e:
+                write_message(self.wfile, dict(ok=False, error=str(e)))
+                return
+            if header is None:
+                return
+
+            started = time.perf_counter()
+            try:
+                body = self.server.state.handle(header, uploads)
+            except Exception as e:
+                logger.exception("request failed")
+                error = f"{type(e).__name__}: {e}"
+                write_message(self.wfile, dict(ok=False, error=error))
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe("serve.request", elapsed)
+
+            write_message(
+                self.wfile, dict(ok=True, seconds=round(elapsed, 6)), body
+            )
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, state: State):
+        self.state = state
+        path = pathlib.Path(path)
+        if path.exists():
+            if is_serving(path):
+                raise RuntimeError(f"{path} is already served")
+            # left by a server that didn't stop cleanly
+            path.unlink()
+        super().__init__(str(path), Handler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def is_serving(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+def request(path, paths=(), uploads=(), fmt="csv", **options):
+    # a client, -> response header, body
+    header = dict(options, format=fmt)
+    if paths:
+        header["paths"] = [str(x) for x in paths]
+    if uploads:
+        header["uploads"] = [len(x) for x in uploads]
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path))
+        f = sock.makefile("rwb")
+        f.write(json.dumps(header).encode() + b"\n")
+        for data in uploads:
+            f.write(data)
+        f.flush()
+
+        response = json.loads(f.readline())
+        body = f.read(response["size"])
+        f.close()
+
+    return response, body
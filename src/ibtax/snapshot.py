@@ -0,0 +1,161 @@
+import json
+import logging
+import pathlib
+from datetime import datetime
+
+from ibtax import equities
+from ibtax.equities import Trade
+from ibtax.lots import Position
+from ibtax.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# bump when the file layout changes
+FORMAT = 1
+
+
+class Snapshot:
+    # lots open at the end of a year, a report started from it needs only
+    # the statements of the following years, see Report.start_from()
+    def __init__(self, year, lots, since=None):
+        self.year = str(year)
+        # symbol -> [(quantity, trade), ...] in the FIFO order, positive
+        # quantities are longs and negative shorts, the trade is the one
+        # opening the lot with its price, date, currency and whole fee
+        self.lots = lots
+        # the first year of the statements the lots are computed from, a
+        # full recompute needs the statements since then
+        self.since = str(since or year)
+
+    def __eq__(self, other):
+        if not isinstance(other, Snapshot):
+            return NotImplemented
+        return self.year == other.year and self.lots == other.lots
+
+    def __repr__(self):
+        return "Snapshot({}, {} symbols)".format(self.year, len(self.lots))
+
+    def currencies(self):
+        return {
+            trade.currency for lots in self.lots.values() for _, trade in lots
+        }
+
+    def start(self):
+        # -> the day of the oldest lot
+        days = [
+            trade.datetime.date()
+            for lots in self.lots.values()
+            for _, trade in lots
+        ]
+        return min(days) if days else None
+
+
+def take(report, year=None) -> Snapshot:
+    # -> lots open at the end of the year, by default the last one of the
+    # report, a report started from lots carries them on
+    year = str(year or report.year)
+    if report.lots is not None and year < report.lots.year:
+        raise ValueError(
+            f"can't take lots of {year}, the report starts from"
+            f" {report.lots.year}"
+        )
+
+    trades, opening = equities.report_trades(report)
+    trades = [x for x in trades if x.datetime.year <= int(year)]
+
+    lots = {}
+    for symb in equities.group_trades(trades, opening):
+        position = Position()
+        equities.take_profits(symb, position)
+
+        found = [(x.quantity, x.item) for x in position.longs]
+        found.extend((-x.quantity, x.item) for x in position.shorts)
+        if found:
+            lots[symb.symbol] = found
+            metrics.count("snapshot.lots", len(found))
+
+    since = report.lots.since if report.lots is not None else report.years[0]
+    return Snapshot(year, lots, since)
+
+
+def compare(expected: Snapshot, found: Snapshot):
+    # -> differences, one per symbol, empty when the lots are the same
+    if expected.year != found.year:
+        return [f"year {expected.year} != {found.year}"]
+
+    differences = []
+    for symbol in sorted(set(expected.lots) | set(found.lots)):
+        a = expected.lots.get(symbol, [])
+        b = found.lots.get(symbol, [])
+        if a == b:
+            continue
+        differences.append(
+            "{}: {} lots of {} != {} lots of {}".format(
+                symbol,
+                len(a),
+                sum(q for q, _ in a),
+                len(b),
+                sum(q for q, _ in b),
+            )
+        )
+    return differences
+
+
+def verify(lots: Snapshot, report):
+    # -> differences of the lots from the ones recomputed of the report,
+    # that has to cover the statements since lots.since
+    if int(report.years[0]) > int(lots.since):
+        logger.warning(
+            "the lots are computed since %s, the reports start in %s",
+            lots.since,
+            report.years[0],
+        )
+    return compare(take(report, lots.year), lots)
+
+
+def to_lot(quantity, trade):
+    values = {name: getattr(trade, name) for name in Trade.fields}
+    values["datetime"] = trade.datetime.isoformat(sep=" ")
+    return dict(open_quantity=quantity, **values)
+
+
+def from_lot(values):
+    values = dict(values)
+    quantity = values.pop("open_quantity")
+    values["datetime"] = datetime.fromisoformat(values["datetime"])
+    return quantity, Trade(**values)
+
+
+def write(path, lots: Snapshot):
+    # json keeps the floats exact, the lots read back equal
+    state = dict(
+        format=FORMAT,
+        year=lots.year,
+        since=lots.since,
+        lots={
+            symbol: [to_lot(q, trade) for q, trade in items]
+            for symbol, items in sorted(lots.lots.items())
+        },
+    )
+    path = pathlib.Path(path)
+    with path.open("w") as f:
+        json.dump(state, f, indent=1, ensure_ascii=False)
+        f.write("\n")
+
+
+def read(path) -> Snapshot:
+    path = pathlib.Path(path)
+    with path.open() as f:
+        state = json.load(f)
+
+    if state.get("format") != FORMAT:
+        raise ValueError(f"{path} is not a lots snapshot of a known format")
+
+    return Snapshot(
+        state["year"],
+        {
+            symbol: [from_lot(x) for x in items]
+            for symbol, items in state["lots"].items()
+        },
+        state["since"],
+    )
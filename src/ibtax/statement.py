@@ -0,0 +1,81 @@
+import csv
+import pathlib
+from collections import defaultdict
+
+
+class StatementReader:
+    def __init__(self):
+        self._consumers = defaultdict(list)
+        self._partial = []
+        # raw (title, kind) -> consumers, resolved once per distinct title
+        # and header
+        self._resolved = {}
+        # raw title -> the last header row of the section
+        self._headers = {}
+        # raw (title, kind) -> rows read
+        self.rows = defaultdict(int)
+
+    def subscribe(
+        self, section, consumer, kind="data", partial=False, schema=None
+    ):
+        # partial subscriptions match any section title containing the name,
+        # some titles vary slightly between statement versions
+        #
+        # with a schema the consumer gets the tuple of the schema columns,
+        # found by the titles of the section header, instead of the row
+        if partial:
+            self._partial.append((section, kind, consumer, schema))
+        else:
+            self._consumers[(section, kind)].append((consumer, schema))
+        self._resolved.clear()
+
+    def _resolve(self, section, kind):
+        title = section
+        section, kind = section.lower(), kind.lower()
+
+        subscribed = list(self._consumers.get((section, kind), ()))
+        for name, partial_kind, consumer, schema in self._partial:
+            if partial_kind == kind and name in section:
+                subscribed.append((consumer, schema))
+
+        consumers = []
+        for consumer, schema in subscribed:
+            if schema is not None:
+                project = schema.projection(self._headers.get(title))
+                consumer = _projected(consumer, project)
+            consumers.append(consumer)
+        return consumers
+
+    def feed(self, row):
+        if len(row) < 2:
+            return
+
+        key = (row[0], row[1])
+        self.rows[key] += 1
+        consumers = self._resolved.get(key)
+        if consumers is None:
+            if row[1].lower() == "header":
+                # sections repeat the header when the columns change, e.g.
+                # trades of another asset category
+                self._headers[row[0]] = row
+                for resolved in [x for x in self._resolved if x[0] == row[0]]:
+                    del self._resolved[resolved]
+                consumers = self._resolve(*key)
+            else:
+                consumers = self._resolved[key] = self._resolve(*key)
+
+        for consumer in consumers:
+            consumer(row)
+
+    def read_lines(self, lines):
+        for row in csv.reader(lines):
+            self.feed(row)
+
+    def read(self, path):
+        path = pathlib.Path(path)
+        with path.open() as f:
+            self.read_lines(f)
+
+
+def _projected(consumer, project):
+    return lambda row: consumer(project(row))
@@ -0,0 +1,198 @@
+import functools
+import pathlib
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+from ibtax.currencies import RateNotFound, RateSeries
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    currency TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (currency, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS intervals (
+    currency TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS catalog (
+    currency TEXT PRIMARY KEY,
+    rq TEXT NOT NULL
+);
+"""
+
+
+def locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RateStore:
+    # daily rates per currency keyed by the day ordinal, along with the
+    # intervals already fetched so only the gaps are requested again
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        # a long lived currency map loads the rates from any thread
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    @locked
+    def close(self):
+        self.db.close()
+
+    @locked
+    def catalog(self) -> Dict[str, str]:
+        return dict(self.db.execute("SELECT currency, rq FROM catalog"))
+
+    @locked
+    def set_catalog(self, catalog: Dict[str, str]):
+        with self.db:
+            self.db.execute("DELETE FROM catalog")
+            self.db.executemany(
+                "INSERT INTO catalog (currency, rq) VALUES (?, ?)",
+                catalog.items(),
+            )
+
+    @locked
+    def currencies(self) -> List[str]:
+        rows = self.db.execute(
+            "SELECT DISTINCT currency FROM intervals ORDER BY currency"
+        )
+        return [x for x, in rows]
+
+    @locked
+    def intervals(self, currency) -> List[Tuple[int, int]]:
+        rows = self.db.execute(
+            "SELECT start, end FROM intervals WHERE currency = ?"
+            " ORDER BY start",
+            (currency,),
+        )
+        return [tuple(x) for x in rows]
+
+    @locked
+    def missing(self, currency, start: date, end: date) -> List[Tuple]:
+        start, end = start.toordinal(), end.toordinal()
+
+        gaps = []
+        for held_start, held_end in self.intervals(currency):
+            if held_end < start:
+                continue
+            if held_start > end:
+                break
+            if held_start > start:
+                gaps.append((start, held_start - 1))
+            start = max(start, held_end + 1)
+        if start <= end:
+            gaps.append((start, end))
+
+        return [(date.fromordinal(a), date.fromordinal(b)) for a, b in gaps]
+
+    @locked
+    def insert(self, currency, records: Iterable[Tuple[int, float]]):
+        # (day ordinal, value)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO rates (currency, day, value)"
+                " VALUES (?, ?, ?)",
+                ((currency, day, value) for day, value in records),
+            )
+
+    @locked
+    def insert_many(self, rows: Iterable[Tuple[str, int, float]]):
+        # (currency, day ordinal, value)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO rates (currency, day, value)"
+                " VALUES (?, ?, ?)",
+                rows,
+            )
+
+    @locked
+    def dump(self, currencies=None) -> Iterable[Tuple[str, int, float]]:
+        if currencies:
+            marks = ", ".join("?" for _ in currencies)
+            return self.db.execute(
+                "SELECT currency, day, value FROM rates"
+                f" WHERE currency IN ({marks}) ORDER BY currency, day",
+                list(currencies),
+            )
+        return self.db.execute(
+            "SELECT currency, day, value FROM rates ORDER BY currency, day"
+        )
+
+    @locked
+    def mark(self, currency, start: date, end: date):
+        # the interval is held, even the days without a record
+        intervals = self.intervals(currency)
+        intervals.append((start.toordinal(), end.toordinal()))
+
+        with self.db:
+            self.db.execute(
+                "DELETE FROM intervals WHERE currency = ?", (currency,)
+            )
+            self.db.executemany(
+                "INSERT INTO intervals (currency, start, end)"
+                " VALUES (?, ?, ?)",
+                ((currency, a, b) for a, b in merge_intervals(intervals)),
+            )
+
+    @locked
+    def add(
+        self,
+        currency,
+        start: date,
+        end: date,
+        records: Iterable[Tuple[int, float]],
+    ):
+        self.insert(currency, records)
+        self.mark(currency, start, end)
+
+    @locked
+    def read(self, currency, start: date, end: date) -> RateSeries:
+        # starts from the last record before the range so the days up to
+        # the first record in the range have a rate too
+        start, end = start.toordinal(), end.toordinal()
+        rows = self.db.execute(
+            "SELECT day, value FROM rates WHERE currency = ? AND day BETWEEN"
+            " COALESCE("
+            "  (SELECT MAX(day) FROM rates WHERE currency = ? AND day <= ?),"
+            "  ?"
+            " ) AND ?"
+            " ORDER BY day",
+            (currency, currency, start, start, end),
+        )
+        try:
+            series = RateSeries.from_days(rows)
+        except ValueError:
+            raise RateNotFound(f"no rates stored for {currency}") from None
+
+        # no records after the last one within a held interval means the
+        # rate didn't change, e.g. the last days of a year
+        last = series.base + len(series) - 1
+        for held_start, held_end in self.intervals(currency):
+            if held_start <= last <= held_end:
+                series.extend(min(held_end, end))
+                break
+
+        return series
@@ -0,0 +1,132 @@
+import http.client
+import logging
+import threading
+import time
+import urllib.parse
+
+from ibtax.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CBR_URL = "https://www.cbr.ru"
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TransportError(Exception):
+    pass
+
+
+class HttpTransport:
+    # keeps idle connections to the rates host open for the next request,
+    # failed requests are retried with an exponential backoff
+    def __init__(self, base_url=CBR_URL, timeout=30.0, retries=3, backoff=0.5):
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported rates url {base_url}")
+
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self._scheme = url.scheme
+        self._netloc = url.netloc
+        self._prefix = url.path.rstrip("/")
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        # -> connection, whether it is an idle one used before
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+
+        if self._scheme == "https":
+            conn = http.client.HTTPSConnection(
+                self._netloc, timeout=self.timeout
+            )
+        else:
+            conn = http.client.HTTPConnection(
+                self._netloc, timeout=self.timeout
+            )
+        return conn, False
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def url(self, path, params=None):
+        url = self._prefix + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params, safe="/")
+        return url
+
+    def _open(self, url):
+        # -> connection, response with a 200 status and the body unread
+        attempt = 0
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request("GET", url)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if reused:
+                    # the server closed the idle connection, not a failure,
+                    # the request goes at once on another one
+                    metrics.count("http.stale_connections")
+                    continue
+                error = TransportError(f"GET {url} failed: {e!r}")
+            else:
+                if response.status == 200:
+                    return conn, response
+
+                response.read()
+                self._release(conn)
+                error = TransportError(f"GET {url}: HTTP {response.status}")
+                if response.status < 500:
+                    raise error
+
+            if attempt == self.retries:
+                raise error
+
+            metrics.count("http.retries")
+            delay = self.backoff * 2**attempt
+            logger.warning("%s, retrying in %.1fs", error, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def stream(self, path, params=None, chunk_size=CHUNK_SIZE):
+        # yields the body as it arrives, retries happen before the first
+        # chunk only
+        url = self.url(path, params)
+        started = time.perf_counter()
+        conn, response = self._open(url)
+        metrics.observe("http.response", time.perf_counter() - started)
+
+        try:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise TransportError(f"GET {url} failed: {e!r}") from e
+        except BaseException:
+            # the consumer stopped early, the rest of the body is unread
+            conn.close()
+            raise
+
+        self._release(conn)
+        metrics.observe("http.request", time.perf_counter() - started)
+
+    def get(self, path, params=None) -> bytes:
+        return b"".join(self.stream(path, params))
+
+    def close(self):
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
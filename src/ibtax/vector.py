@@ -0,0 +1,117 @@
+from itertools import repeat
+from operator import mul
+from typing import Sequence
+
+from ibtax.currencies import CurrencyMap, OUT_OF_RANGE_LAST_KNOWN
+
+try:
+    import numpy as np
+except ImportError:  # a dependency, the plain python path is kept
+    np = None
+
+
+def rates(currencies_map: CurrencyMap, currencies: Sequence, days: Sequence):
+    # rate per item, with numpy a single gather per distinct currency
+    if np is None:
+        return [currencies_map.get(c, d) for c, d in zip(currencies, days)]
+
+    size = len(days)
+    if not size:
+        return []
+    result = np.ones(size)
+
+    ordinals = np.fromiter((d.toordinal() for d in days), np.int64, size)
+    names, groups = np.unique(np.array(currencies), return_inverse=True)
+
+    for i, name in enumerate(names.tolist()):
+        if name == currencies_map.self_currency:
+            continue
+
+        mask = groups == i
+        series = currencies_map.series(name)
+        values = np.frombuffer(series.values, dtype=np.float64)
+
+        idx = ordinals[mask] - series.base
+        outside = idx < 0
+        if currencies_map.out_of_range != OUT_OF_RANGE_LAST_KNOWN:
+            outside |= idx >= len(values)
+        if outside.any():
+            # raises with the offending date
+            first = int(np.flatnonzero(mask)[np.argmax(outside)])
+            currencies_map.get(name, days[first])
+        idx = np.minimum(idx, len(values) - 1)
+
+        result[mask] = values[idx]
+
+    # python floats, np.float64 items are slow to work with one by one
+    return result.tolist()
+
+
+def convert(units: Sequence, rate_units: Sequence, divisor: int, base: int):
+    # -> python ints of units * rate units / divisor rounded half away from
+    # zero as money.convert(), None when int64 could overflow
+    size = len(units)
+    if not size:
+        return []
+    try:
+        amounts = np.fromiter(units, np.int64, size)
+    except OverflowError:
+        return None
+    return _convert(amounts, rate_units, divisor, base)
+
+
+def convert_scaled(
+    values: Sequence, units: int, rate_units: Sequence, divisor: int, base: int
+):
+    # -> convert(scale(values, units), ...) without the python ints between
+    size = len(values)
+    if not size:
+        return []
+    scaled = np.rint(np.fromiter(values, np.float64, size) * units)
+    if not np.abs(scaled).max() < 2**62:
+        return None
+    return _convert(scaled.astype(np.int64), rate_units, divisor, base)
+
+
+def _convert(amounts, rate_units: Sequence, divisor: int, base: int):
+    # the products don't fit int64, the rates are split by base, a factor of
+    # the divisor, u * r = u * hi * base + u * lo, so that
+    # (u * r + half) // divisor == (u * hi + u * lo // base + half // base)
+    # // (divisor // base) for u >= 0
+    try:
+        rates = np.fromiter(rate_units, np.int64, len(amounts))
+    except OverflowError:
+        return None
+    if rates.min() < 0:
+        return None
+
+    hi, lo = np.divmod(rates, base)
+    magnitudes = np.abs(amounts)
+    if int(magnitudes.max()) * max(int(hi.max()), base) >= 2**62:
+        return None
+
+    found = (
+        magnitudes * hi + magnitudes * lo // base + divisor // 2 // base
+    ) // (divisor // base)
+    return np.where(amounts < 0, -found, found).tolist()
+
+
+def tax_due(kopecks: Sequence, percent: int, paid: Sequence = None):
+    # -> python ints, percent of the positive kopecks rounded half up less
+    # what was paid, none on losses, as money.to_pay()
+    amounts = np.fromiter(kopecks, np.int64, len(kopecks))
+    due = (amounts * percent + 50) // 100
+    if paid is not None:
+        due = np.maximum(due - np.fromiter(paid, np.int64, len(paid)), 0)
+    return np.where(amounts > 0, due, 0).tolist()
+
+
+def scale(values: Sequence, units: int):
+    # -> python ints of round(value * units), rounded half to even on both
+    # paths so they agree to the unit
+    if np is not None:
+        scaled = np.rint(np.asarray(values, dtype=np.float64) * units)
+        # past int64, python ints don't overflow
+        if not len(scaled) or np.abs(scaled).max() < 2**62:
+            return scaled.astype(np.int64).tolist()
+    return list(map(round, map(mul, values, repeat(units))))
@@ -0,0 +1,28 @@
+from ibtax.batch import discover
+
+
+def test_discover_both_layouts(tmp_path):
+    for name in (
+        "U1/2020.csv",
+        "U1/2019.csv",
+        "U1/notes.txt",
+        "U2_20200101_20201231.csv",
+        "U2_20190101_20191231.CSV",
+        "U3.csv",
+        "readme.txt",
+    ):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text("")
+    (tmp_path / "empty").mkdir()
+
+    accounts = discover(tmp_path)
+
+    assert {
+        account: [x.relative_to(tmp_path).as_posix() for x in paths]
+        for account, paths in accounts.items()
+    } == {
+        "U1": ["U1/2019.csv", "U1/2020.csv"],
+        "U2": ["U2_20190101_20191231.CSV", "U2_20200101_20201231.csv"],
+        "U3": ["U3.csv"],
+    }
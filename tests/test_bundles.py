@@ -0,0 +1,104 @@
+from datetime import date
+
+import pytest
+
+from ibtax import bundles
+from ibtax.store import RateStore
+
+
+@pytest.fixture
+def store():
+    store = RateStore(":memory:")
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def target():
+    store = RateStore(":memory:")
+    yield store
+    store.close()
+
+
+def records(*days):
+    return [(x.toordinal(), 70.0 + i) for i, x in enumerate(days)]
+
+
+def test_round_trip_keeps_the_held_intervals(store, target, tmp_path):
+    # the year ends on a weekend after the last record
+    store.add(
+        "USD",
+        date(2021, 1, 1),
+        date(2021, 12, 31),
+        records(date(2021, 1, 12), date(2021, 6, 1), date(2021, 12, 30)),
+    )
+    store.add(
+        "CAD",
+        date(2021, 12, 1),
+        date(2021, 12, 31),
+        records(date(2021, 12, 1), date(2021, 12, 29)),
+    )
+    path = tmp_path / "rates.csv"
+
+    assert bundles.export_csv(store, path) == 5
+    assert bundles.import_file(target, path) == dict(USD=3, CAD=2)
+
+    assert list(target.dump()) == list(store.dump())
+    for currency in ("USD", "CAD"):
+        assert target.intervals(currency) == store.intervals(currency)
+    assert target.missing("USD", date(2021, 1, 1), date(2021, 12, 31)) == []
+    assert target.read("CAD", date(2021, 12, 1), date(2021, 12, 31)).last == (
+        date(2021, 12, 31)
+    )
+
+
+def test_export_of_some_currencies(store, target, tmp_path):
+    store.add("USD", date(2021, 1, 1), date(2021, 1, 31), [])
+    store.add("CAD", date(2021, 1, 1), date(2021, 1, 31), [])
+    path = tmp_path / "rates.csv"
+
+    bundles.export_csv(store, path, ["USD"])
+    bundles.import_file(target, path)
+
+    assert target.currencies() == ["USD"]
+
+
+def test_first_version_is_held_between_the_records(target, tmp_path):
+    # no intervals, a gap longer than the holidays splits them
+    path = tmp_path / "rates.csv"
+    path.write_text(
+        "currency,date,value\n"
+        "usd,2021-01-12,73.5\n"
+        "usd,2021-01-13,73.6\n"
+        "usd,2021-03-01,74.0\n"
+    )
+
+    assert bundles.import_file(target, path) == dict(USD=3)
+
+    assert target.intervals("USD") == [
+        (date(2021, 1, 12).toordinal(), date(2021, 1, 13).toordinal()),
+        (date(2021, 3, 1).toordinal(), date(2021, 3, 1).toordinal()),
+    ]
+
+
+def test_not_a_snapshot(target, tmp_path):
+    path = tmp_path / "rates.csv"
+    path.write_text("day,rate\n")
+
+    with pytest.raises(ValueError, match="not a rates snapshot"):
+        bundles.import_file(target, path)
+
+
+def test_xml_response_marks_the_requested_range(target, tmp_path):
+    path = tmp_path / "usd.xml"
+    path.write_bytes(
+        b'<?xml version="1.0" encoding="windows-1251"?>\n'
+        b'<ValCurs ID="R01235" DateRange1="01.12.2021"'
+        b' DateRange2="31.12.2021" name="Foreign Currency Market Dynamic">'
+        b'<Record Date="30.12.2021" Id="R01235"><Nominal>1</Nominal>'
+        b"<Value>73,5</Value></Record></ValCurs>"
+    )
+
+    assert bundles.import_file(target, path) == dict(USD=1)
+
+    assert target.missing("USD", date(2021, 12, 1), date(2021, 12, 31)) == []
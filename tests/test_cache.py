@@ -0,0 +1,57 @@
+import threading
+
+from ibtax import cache as cache_module
+from ibtax.cache import StatementCache
+
+
+def statements(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f"{i}.csv"
+        path.write_text(str(i))
+        paths.append(path)
+    return paths
+
+
+def fail(path):
+    raise AssertionError(f"{path} is hashed again")
+
+
+def test_statement_cache_shared_by_threads(tmp_path):
+    paths = statements(tmp_path, 20)
+    cache = StatementCache(tmp_path / "cache", "1")
+
+    threads = [
+        threading.Thread(target=cache.set, args=(x, x.name)) for x in paths
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [cache.get(x) for x in paths] == [x.name for x in paths]
+
+
+def test_stamps_of_every_process_are_kept(tmp_path, monkeypatch):
+    # every batch worker opens the cache of its own
+    paths = statements(tmp_path, 4)
+    first = StatementCache(tmp_path / "cache", "1")
+    second = StatementCache(tmp_path / "cache", "1")
+    for path in paths[:2]:
+        first.set(path, path.name)
+    for path in paths[2:]:
+        second.set(path, path.name)
+
+    # the next run hashes none of them
+    monkeypatch.setattr(cache_module, "file_digest", fail)
+    cache = StatementCache(tmp_path / "cache", "1")
+    assert [cache.get(x) for x in paths] == [x.name for x in paths]
+
+
+def test_changed_statement_is_hashed_again(tmp_path):
+    (path,) = statements(tmp_path, 1)
+    StatementCache(tmp_path / "cache", "1").set(path, "old")
+
+    path.write_text("changed")
+
+    assert StatementCache(tmp_path / "cache", "1").get(path) is None
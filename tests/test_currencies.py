@@ -0,0 +1,54 @@
+from datetime import date
+
+import pytest
+
+from ibtax import vector
+from ibtax.currencies import (
+    OUT_OF_RANGE_ERROR,
+    OUT_OF_RANGE_LAST_KNOWN,
+    CurrencyMap,
+    RateNotFound,
+    RateSeries,
+)
+
+
+def series():
+    # friday and monday, the weekend carries the friday rate
+    return RateSeries.from_days(
+        [
+            (date(2020, 1, 10).toordinal(), 60.0),
+            (date(2020, 1, 13).toordinal(), 61.0),
+        ]
+    )
+
+
+def test_days_without_a_record_carry_the_previous_rate():
+    assert series().get(date(2020, 1, 12)) == 60.0
+    assert series().get(date(2020, 1, 13)) == 61.0
+
+
+def test_out_of_range_error():
+    with pytest.raises(RateNotFound):
+        series().get(date(2020, 1, 14), OUT_OF_RANGE_ERROR)
+
+
+def test_out_of_range_last_known():
+    assert series().get(date(2020, 2, 1), OUT_OF_RANGE_LAST_KNOWN) == 61.0
+
+
+def test_no_last_known_rate_before_the_series():
+    with pytest.raises(RateNotFound):
+        series().get(date(2020, 1, 9), OUT_OF_RANGE_LAST_KNOWN)
+
+
+@pytest.mark.skipif(vector.np is None, reason="numpy is not installed")
+def test_vector_rates_last_known():
+    currencies_map = CurrencyMap("RUB", OUT_OF_RANGE_LAST_KNOWN)
+    currencies_map.add("USD", series())
+
+    days = [date(2020, 1, 12), date(2020, 2, 1)]
+    assert vector.rates(currencies_map, ["USD", "RUB"], days) == [60.0, 1.0]
+    assert vector.rates(currencies_map, ["USD"] * 2, days) == [60.0, 61.0]
+
+    with pytest.raises(RateNotFound):
+        vector.rates(currencies_map, ["USD"], [date(2020, 1, 9)])
@@ -0,0 +1,74 @@
+from datetime import date
+
+from ibtax.dividends import Payout, Withhold, match
+
+DAY = date(2020, 3, 2)
+
+
+def payout(value, symbol="AAPL", day=DAY):
+    return Payout(
+        currency="USD",
+        date=day,
+        description=f"{symbol} (US0378331005) Cash Dividend",
+        symbol=symbol,
+        value=value,
+    )
+
+
+def withhold(value, symbol="AAPL", day=DAY):
+    return Withhold(
+        currency="USD",
+        date=day,
+        description=f"{symbol} (US0378331005) Cash Dividend - US Tax",
+        symbol=symbol,
+        value=value,
+        code="",
+    )
+
+
+def test_reversal_and_reissue_are_summed():
+    # paid, reversed and paid again with a corrected amount
+    payouts = [payout(10.0), payout(-10.0), payout(12.5)]
+    withholds = [withhold(-1.0), withhold(1.0), withhold(-1.25)]
+
+    matching = match(payouts, withholds)
+
+    (event,) = matching.events
+    assert event.payout.value == 12.5
+    assert event.withhold.value == -1.25
+    assert matching.summary() == dict(
+        events=1, unmatched_payouts=[], unmatched_withholds=[]
+    )
+
+
+def test_withhold_without_a_payout():
+    other = date(2020, 3, 3)
+
+    matching = match(
+        [payout(10.0)], [withhold(-1.0), withhold(-0.5, day=other)]
+    )
+
+    (event,) = matching.events
+    assert event.withhold.value == -1.0
+    assert [x.value for x in matching.unmatched_withholds] == [-0.5]
+    assert matching.summary() == dict(
+        events=1,
+        unmatched_payouts=[],
+        unmatched_withholds=[("AAPL", other, "USD")],
+    )
+
+
+def test_payout_without_a_withhold():
+    matching = match(
+        [payout(10.0), payout(3.0, symbol="MSFT")], [withhold(-1.0)]
+    )
+
+    # the payout is still reported, with no tax paid
+    assert [x.payout.symbol for x in matching.events] == ["AAPL", "MSFT"]
+    assert matching.events[1].withhold.value == 0.0
+    assert [x.value for x in matching.unmatched_payouts] == [3.0]
+    assert matching.summary() == dict(
+        events=2,
+        unmatched_payouts=[("MSFT", DAY, "USD")],
+        unmatched_withholds=[],
+    )
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+from ibtax.equities import SymbolTrades, Trade, take_profits
+
+
+def trade(day, quantity, code, realized_pl=0.0, price=10.0):
+    return Trade(
+        asset_category="Stocks",
+        currency="USD",
+        symbol="AAPL",
+        datetime=datetime(2020, 1, day, 10),
+        quantity=quantity,
+        t_price=price,
+        comm_fee=-1.0,
+        realized_pl=realized_pl,
+        code=code,
+    )
+
+
+def matched(take_profit):
+    return [(x.quantity, x.trade.datetime.day) for x in take_profit.buys]
+
+
+def test_sell_splits_a_lot():
+    buy = trade(1, 10, "O")
+    sells = [trade(2, -4, "C", 4.0), trade(3, -6, "C", 6.0)]
+
+    found = take_profits(SymbolTrades("AAPL", [buy] + sells))
+
+    assert [x.sell for x in found] == sells
+    assert [matched(x) for x in found] == [[(4, 1)], [(6, 1)]]
+    assert [x.quantity for x in found] == [4, 6]
+
+
+def test_sell_takes_lots_in_fifo_order():
+    trades = [trade(1, 3, "O"), trade(2, 5, "O"), trade(3, -6, "C", 6.0)]
+
+    (found,) = take_profits(SymbolTrades("AAPL", trades))
+
+    assert matched(found) == [(3, 1), (3, 2)]
+    assert found.quantity == 6
+
+
+def test_short_open_and_cover():
+    sells = [trade(1, -3, "O"), trade(2, -2, "O")]
+    cover = trade(3, 5, "C", realized_pl=10.01)
+
+    found = take_profits(SymbolTrades("AAPL", sells + [cover]))
+
+    # every short sale is a profit closed by the buy
+    assert [x.sell for x in found] == sells
+    assert [x.closing for x in found] == [cover, cover]
+    assert [matched(x) for x in found] == [[(3, 3)], [(2, 3)]]
+    assert [x.quantity for x in found] == [3, 2]
+    # the buy realized p/l is shared, not repeated per short
+    assert [x.realized_pl for x in found] == [6.01, 4.0]
+
+
+def test_buy_covers_a_short_and_opens_a_long():
+    trades = [
+        trade(1, -2, "O"),
+        trade(2, 5, "C;O", realized_pl=1.0),
+        trade(3, -3, "C", realized_pl=2.0),
+    ]
+
+    short, sell = take_profits(SymbolTrades("AAPL", trades))
+
+    assert matched(short) == [(2, 2)]
+    assert short.realized_pl == 1.0
+    assert matched(sell) == [(3, 2)]
+
+
+def test_sell_without_the_buys_is_not_a_short():
+    # the position was opened before the statements
+    closing = trade(1, -5, "C", realized_pl=5.0)
+    buy = trade(2, 4, "O")
+    sell = trade(3, -4, "C", realized_pl=1.0)
+
+    first, second = take_profits(SymbolTrades("AAPL", [closing, buy, sell]))
+
+    # the whole sell without buys, as there is no cost of it
+    assert first.sell is closing
+    assert first.buys == []
+    assert first.quantity == 5
+    # the later buy is left to the later sell
+    assert second.sell is sell
+    assert matched(second) == [(4, 2)]
+
+
+def test_sell_partially_without_the_buys():
+    trades = [trade(1, 2, "O"), trade(2, -5, "C", realized_pl=5.0)]
+
+    (found,) = take_profits(SymbolTrades("AAPL", trades))
+
+    assert matched(found) == [(2, 1)]
+    assert found.quantity == 5
+
+
+def test_lots_open_before_the_trades():
+    lot = trade(1, 10, "O")
+    sell = trade(5, -4, "C", realized_pl=1.0)
+
+    (found,) = take_profits(SymbolTrades("AAPL", [sell], [(6, lot)]))
+
+    assert matched(found) == [(4, 1)]
@@ -0,0 +1,95 @@
+import pytest
+
+from ibtax import money, vector
+from ibtax.formatting import to_k
+
+
+@pytest.fixture(params=["numpy", "python"])
+def paths(request, monkeypatch):
+    # the results don't depend on numpy
+    if request.param == "python":
+        monkeypatch.setattr(vector, "np", None)
+    elif vector.np is None:
+        pytest.skip("numpy is not installed")
+
+
+def test_convert_rounds_half_away_from_zero(paths):
+    # 0.5 kopecks is 10**12 / 2 of units * rate units
+    half = money.UNITS * money.RATE_UNITS // money.KOPECKS // 2
+    units = [half, half - 1, -half, -(half - 1), 3 * half, 0]
+
+    assert money.convert(units, [1] * len(units)) == [1, 0, -1, 0, 2, 0]
+
+
+@pytest.mark.parametrize(
+    "units, rate_units",
+    [
+        # split rates, 0.5 kopecks at 1e4 and 12.345 usd at 73.5 rub
+        ([5 * 10**7, -5 * 10**7, 12345000], [10**4, 10**4, 7350000000]),
+        # 10 bln usd at 100 rub don't fit int64
+        ([10**16, 1], [10**10, 10**10]),
+    ],
+)
+def test_convert_is_the_same_without_numpy(units, rate_units, monkeypatch):
+    found = money.convert(units, rate_units)
+
+    monkeypatch.setattr(vector, "np", None)
+    assert found == money.convert(units, rate_units)
+    assert all(type(x) is int for x in found)
+
+
+def test_to_rub_many_is_exact(paths):
+    # 0.005 usd at 1 rub and 12.345 usd at 73.5 rub, 907.3575 rub
+    amounts = [0.005, 12.345, -12.345, 0.004]
+    rates = [1.0, 73.5, 73.5, 1.0]
+
+    assert money.to_rub_many(amounts, rates) == [1, 90736, -90736, 0]
+
+
+def test_to_rub_many_past_int64(paths):
+    # 10 trillion usd are 10**19 units
+    assert money.to_rub_many([1e13, -1e13], [100.0, 1.0]) == [
+        10**17,
+        -(10**15),
+    ]
+
+
+def test_tax_rounds_half_up():
+    assert money.tax(50) == 7
+    assert money.tax(150) == 20
+    assert money.tax(100) == 13
+    assert money.tax(0) == 0
+    assert money.tax(-1000) == 0
+
+
+def test_to_pay(paths):
+    assert money.to_pay([1000, 150, 0, -1000]) == [130, 20, 0, 0]
+
+
+def test_to_pay_credits_withheld_tax(paths):
+    amounts = [1000, 1000, 1000, -1000]
+    paid = [100, 130, 200, 100]
+
+    assert money.to_pay(amounts, paid) == [30, 0, 0, 0]
+
+
+def test_to_pay_returns_ints(paths):
+    assert all(type(x) is int for x in money.to_pay([1000], [1]))
+
+
+@pytest.mark.parametrize(
+    "kopecks, text",
+    [
+        (0, "0,00"),
+        (5, "0,05"),
+        (99, "0,99"),
+        (100, "1,00"),
+        (123456, "1234,56"),
+        (-5, "-0,05"),
+        (-99, "-0,99"),
+        (-100, "-1,00"),
+        (-123456, "-1234,56"),
+    ],
+)
+def test_to_k(kopecks, text):
+    assert to_k(kopecks) == text
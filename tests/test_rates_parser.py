@@ -0,0 +1,87 @@
+from datetime import date
+from xml.dom import minidom
+
+import pytest
+
+from ibtax.currencies import RatesParser, from_cb_date, parse_rates
+
+RESPONSE = """\
+<?xml version="1.0" encoding="windows-1251"?>
+<ValCurs ID="R01200" DateRange1="09.01.2020" DateRange2="14.01.2020" \
+name="Foreign Currency Market Dynamic">
+<Record Date="09.01.2020" Id="R01200"><Nominal>10</Nominal>\
+<Value>80,1234</Value></Record>
+<Record Date="10.01.2020" Id="R01200"><Nominal>10</Nominal>\
+<Value>79,5678</Value></Record>
+<Record Date="14.01.2020" Id="R01200"><Nominal>10</Nominal>\
+<Value>78,9</Value></Record>
+</ValCurs>
+""".encode("cp1251")
+
+
+def parse_dom(contents):
+    # how the responses were parsed before the streaming parser
+    dom = minidom.parseString(contents)
+    parsed = []
+    for node in dom.getElementsByTagName("Record"):
+        day = from_cb_date(node.attributes["Date"].value)
+        nominal = node.getElementsByTagName("Nominal")[0].firstChild
+        value = node.getElementsByTagName("Value")[0].firstChild
+        parsed.append(
+            (
+                day.toordinal(),
+                float(value.nodeValue.replace(",", "."))
+                / int(nominal.nodeValue),
+            )
+        )
+    return parsed
+
+
+def chunked(contents, sizes):
+    chunks = []
+    for size in sizes:
+        chunks.append(contents[:size])
+        contents = contents[size:]
+    return chunks + [contents]
+
+
+def parse(chunks):
+    return [x for batch in parse_rates(chunks) for x in batch]
+
+
+def test_the_same_as_the_dom():
+    expected = parse_dom(RESPONSE)
+
+    assert parse([RESPONSE]) == expected
+    # per unit of the nominal
+    assert expected == [
+        (date(2020, 1, 9).toordinal(), 80.1234 / 10),
+        (date(2020, 1, 10).toordinal(), 79.5678 / 10),
+        (date(2020, 1, 14).toordinal(), 78.9 / 10),
+    ]
+
+
+def test_split_inside_a_value():
+    at = RESPONSE.index(b"79,56") + 3
+
+    assert parse([RESPONSE[:at], RESPONSE[at:]]) == parse_dom(RESPONSE)
+
+
+@pytest.mark.parametrize("sizes", [[1] * len(RESPONSE), [7] * 60, [100, 3]])
+def test_arbitrary_chunks(sizes):
+    assert parse(chunked(RESPONSE, sizes)) == parse_dom(RESPONSE)
+
+
+def test_every_split_point():
+    expected = parse_dom(RESPONSE)
+
+    for at in range(len(RESPONSE)):
+        assert parse([RESPONSE[:at], RESPONSE[at:]]) == expected
+
+
+def test_range_of_the_response():
+    parser = RatesParser()
+    parser.feed(RESPONSE, final=True)
+
+    assert parser.rq == "R01200"
+    assert (parser.start, parser.end) == (date(2020, 1, 9), date(2020, 1, 14))
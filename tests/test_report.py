@@ -0,0 +1,90 @@
+from datetime import date
+
+import pytest
+
+from ibtax import api
+from ibtax.currencies import CurrencyMap, RateSeries
+from ibtax.lends import LendInterest
+from ibtax.report import RECORD_TYPES, Report, expand_paths
+
+LENDS = (
+    "IBKR Managed Securities Lent Interest Details"
+    " (Stock Yield Enhancement Program)"
+)
+
+STATEMENT = f"""\
+Statement,Header,Field Name,Field Value
+Statement,Data,Period,"January 1, 2020 - December 31, 2020"
+Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,\
+Quantity,T. Price,C. Price,Proceeds,Comm/Fee,Basis,Realized P/L,MTM P/L,Code
+Trades,Data,Order,Stocks,USD,AAPL,"2020-01-10, 10:00:00",10,100,100,-1000,\
+-1,1000,0,0,O
+Trades,Data,Order,Forex,RUB,USD.RUB,"2020-01-10, 11:00:00","-1,500",73.5,\
+73.5,110250,-2,,,0,
+Trades,Data,Order,Stocks,USD,AAPL,"2020-01-13, 10:00:00",-10,110,110,1100,\
+-1,-1000,98,0,C
+{LENDS},Header,Currency,Value Date,Symbol,Start Date,Quantity,\
+Collateral Amount,Interest Rate Earned by IB,Interest Paid to IB,\
+Interest Rate on Customer Collateral,Interest Paid to Customer,Code
+{LENDS},Data,USD,2020-01-13,AAPL,2020-01-13,,1000,1,0.1,0.5,0.05,
+"""
+
+
+def report(*years):
+    return Report(list(years), {x: [] for x in RECORD_TYPES})
+
+
+def test_merge_in_period_order():
+    merged = Report.merge([report("2020"), report("2019")])
+
+    assert merged.years == ["2019", "2020"]
+
+
+def test_merge_rejects_overlapping_reports():
+    with pytest.raises(ValueError, match="merged.csv and 2019.csv"):
+        Report.merge(
+            [report("2019", "2020"), report("2019")],
+            ["merged.csv", "2019.csv"],
+        )
+
+
+def test_parse_rejects_a_year_repeated_in_a_file():
+    # the same statement appended twice
+    lines = (STATEMENT + STATEMENT).splitlines(keepends=True)
+
+    with pytest.raises(ValueError, match="merged.csv covers 2020 twice"):
+        Report.parse(lines, "merged.csv")
+
+
+def test_expand_paths_reads_a_path_once(tmp_path):
+    for name in ("2019.csv", "2020.csv"):
+        (tmp_path / name).write_text("")
+
+    paths = expand_paths(
+        [
+            str(tmp_path / "2019.csv"),
+            str(tmp_path / "*.csv"),
+            str(tmp_path / "." / "2020.csv"),
+        ]
+    )
+
+    assert [x.name for x in paths] == ["2019.csv", "2020.csv"]
+
+
+def test_rows_of_other_assets_are_not_converted(tmp_path):
+    # the forex quantity has a thousands separator, the lend none at all
+    path = tmp_path / "2020.csv"
+    path.write_text(STATEMENT)
+    currencies = CurrencyMap("RUB")
+    days = [date(2020, 1, 1), date(2020, 12, 31)]
+    currencies.add(
+        "USD", RateSeries.from_days([(x.toordinal(), 60.0) for x in days])
+    )
+
+    result = api.compute([path], currencies)
+
+    assert [x.symbol for x in result["2020"].equities] == ["AAPL"]
+    assert [x.item.symbol for x in result["2020"].lends] == ["AAPL"]
+    (lend,) = Report.read(path).records(LendInterest)
+    with pytest.raises(ValueError):
+        lend.quantity
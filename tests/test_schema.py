@@ -0,0 +1,93 @@
+import logging
+
+from ibtax.equities import Trade
+from ibtax.schema import Column, Schema
+from ibtax.statement import StatementReader
+
+
+def schema():
+    return Schema(
+        "test",
+        [
+            Column("currency", ("Currency", "Валюта"), 2),
+            Column("amount", ("Amount", "Сумма"), 3),
+        ],
+    )
+
+
+def test_english_and_russian_titles():
+    english = schema().projection(["Test", "Header", "Amount", "Currency"])
+    russian = schema().projection(["Test", "Header", "Сумма", "Валюта"])
+
+    assert english(["Test", "Data", "1.5", "USD"]) == ("USD", "1.5")
+    assert russian(["Test", "Data", "1.5", "USD"]) == ("USD", "1.5")
+
+
+def test_titles_ignore_case_and_spaces():
+    project = schema().projection(["Test", "Header", " AMOUNT ", "currency"])
+
+    assert project(["Test", "Data", "1.5", "USD"]) == ("USD", "1.5")
+
+
+def test_missing_title_is_read_by_position(caplog):
+    found = schema()
+    header = ["Test", "Header", "Currency", "Total"]
+
+    with caplog.at_level(logging.WARNING, logger="ibtax.schema"):
+        project = found.projection(header)
+        found.projection(header)
+
+    assert project(["Test", "Data", "USD", "1.5"]) == ("USD", "1.5")
+    # once per header layout
+    assert [x.getMessage() for x in caplog.records] == [
+        "test: no amount in the header, read by position"
+    ]
+
+
+def test_without_a_header_by_position():
+    project = schema().projection()
+
+    assert project(["Test", "Data", "USD", "1.5"]) == ("USD", "1.5")
+
+
+def test_short_rows_are_padded():
+    project = schema().projection(["Test", "Header", "Amount", "Currency"])
+
+    assert project(["Test", "Data", "1.5"]) == ("", "1.5")
+
+
+def test_single_column_is_a_tuple():
+    project = Schema("test", [Column("amount", ("Amount",), 2)]).projection()
+
+    assert project(["Test", "Data", "1.5"]) == ("1.5",)
+
+
+def test_repeated_header_switches_the_layout():
+    # trades of another asset category come with their own header
+    lines = [
+        "Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,"
+        "Date/Time,Quantity,T. Price,C. Price,Proceeds,Comm/Fee,Basis,"
+        "Realized P/L,MTM P/L,Code",
+        'Trades,Data,Order,Stocks,USD,AAPL,"2020-01-10, 10:00:00",10,100,'
+        "100,-1000,-1,1000,0,0,O",
+        "Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,"
+        "Date/Time,Quantity,T. Price,Proceeds,Comm/Fee,Code",
+        'Trades,Data,Order,Forex,RUB,USD.RUB,"2020-01-10, 11:00:00",'
+        '"-1,500",73.5,110250,-2,',
+    ]
+    trades = []
+    reader = StatementReader()
+    Trade.subscribe(reader, trades.append)
+
+    reader.read_lines(lines)
+
+    stock, forex = trades
+    assert (stock.symbol, stock.quantity, stock.t_price) == ("AAPL", 10, 100)
+    assert (stock.comm_fee, stock.code) == (-1.0, "O")
+    assert (forex.symbol, forex.quantity, forex.t_price) == (
+        "USD.RUB",
+        -1500,
+        73.5,
+    )
+    # no realized p/l in the forex header, read from a short row
+    assert (forex.comm_fee, forex.realized_pl, forex.code) == (-2.0, 0.0, "")
@@ -0,0 +1,126 @@
+import io
+import json
+import threading
+from datetime import date
+
+import pytest
+
+from ibtax import server
+from ibtax.currencies import CurrencyMap, RateSeries
+from ibtax.report import RECORD_TYPES, Report
+from ibtax.server import RequestError, State, read_message, write_message
+
+STATEMENT = b"""\
+Statement,Header,Field Name,Field Value
+Statement,Data,Period,"January 1, 2020 - December 31, 2020"
+Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,\
+Quantity,T. Price,C. Price,Proceeds,Comm/Fee,Basis,Realized P/L,MTM P/L,Code
+Trades,Data,Order,Stocks,USD,AAPL,"2020-01-10, 10:00:00",10,100,100,-1000,\
+-1,1000,0,0,O
+Trades,Data,Order,Stocks,USD,AAPL,"2020-01-13, 10:00:00",-10,110,110,1100,\
+-1,-1000,98,0,C
+"""
+
+
+def build_map(start, end, currencies):
+    result = CurrencyMap("RUB")
+    result.add(
+        "USD",
+        RateSeries.from_days([(x.toordinal(), 60.0) for x in (start, end)]),
+    )
+    return result
+
+
+def message(header, *uploads):
+    return io.BytesIO(json.dumps(header).encode() + b"\n" + b"".join(uploads))
+
+
+def test_request_round_trip():
+    request = message(dict(uploads=[len(STATEMENT)]), STATEMENT)
+
+    header, uploads = read_message(request)
+    body = State(build_map).handle(header, uploads)
+
+    response = io.BytesIO()
+    write_message(response, dict(ok=True), body)
+    response.seek(0)
+    assert json.loads(response.readline()) == dict(ok=True, size=len(body))
+    assert response.read() == body
+    assert b"AAPL" in body
+    # the end of the stream
+    assert read_message(request) == (None, None)
+
+
+def test_json_format():
+    header, uploads = read_message(
+        message(dict(uploads=[len(STATEMENT)], format="json"), STATEMENT)
+    )
+
+    result = json.loads(State(build_map).handle(header, uploads))
+
+    (profit,) = result["years"]["2020"]["equities"]
+    assert profit["take_profit"]["sell"]["quantity"] == -10
+
+
+@pytest.mark.parametrize(
+    "sizes",
+    [[-1], [server.MAX_UPLOAD + 1], ["10"], [1.5], [True], 10],
+)
+def test_bad_upload_sizes(sizes):
+    with pytest.raises(RequestError):
+        read_message(message(dict(uploads=sizes), STATEMENT))
+
+
+def test_cut_short_body():
+    with pytest.raises(RequestError, match="cut short"):
+        read_message(message(dict(uploads=[len(STATEMENT) + 1]), STATEMENT))
+
+
+def report(year):
+    return Report([year], {x: [] for x in RECORD_TYPES})
+
+
+def test_a_period_being_built_does_not_block_the_others():
+    building = threading.Event()
+    release = threading.Event()
+
+    def slow_map(start, end, currencies):
+        if start.year == 2019:
+            building.set()
+            release.wait(5)
+        return build_map(start, end, currencies)
+
+    state = State(slow_map)
+    warm = state.currency_map(report("2020"))
+
+    found = []
+    thread = threading.Thread(
+        target=lambda: found.append(state.currency_map(report("2019")))
+    )
+    thread.start()
+    building.wait(5)
+
+    # answered while 2019 is still being built
+    assert state.currency_map(report("2020")) is warm
+    assert not found
+
+    release.set()
+    thread.join(5)
+    assert found and found[0].get("USD", date(2019, 6, 1)) == 60.0
+
+
+def test_a_failed_map_is_built_again():
+    calls = []
+
+    def failing_map(start, end, currencies):
+        calls.append(start)
+        if len(calls) == 1:
+            raise OSError("no network")
+        return build_map(start, end, currencies)
+
+    state = State(failing_map)
+    with pytest.raises(OSError):
+        state.currency_map(report("2020"))
+
+    assert state.currency_map(report("2020")) is not None
+    assert len(calls) == 2
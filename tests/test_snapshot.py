@@ -0,0 +1,96 @@
+from datetime import date, datetime
+
+import pytest
+
+from ibtax import api, equities, snapshot
+from ibtax.currencies import CurrencyMap, RateSeries
+from ibtax.equities import Trade
+from ibtax.report import RECORD_TYPES, Report
+
+
+def trade(symbol, day, quantity, code, realized_pl=0.0, price=10.0):
+    return Trade(
+        asset_category="Stocks",
+        currency="USD",
+        symbol=symbol,
+        datetime=datetime(*day, 10),
+        quantity=quantity,
+        t_price=price,
+        comm_fee=-1.0,
+        realized_pl=realized_pl,
+        code=code,
+    )
+
+
+TRADES = [
+    # a long sold partially in 2019 and the rest in 2020
+    trade("AAPL", (2019, 2, 1), 10, "O", price=100.0),
+    trade("AAPL", (2019, 6, 1), 5, "O", price=120.0),
+    trade("AAPL", (2019, 9, 1), -7, "C", 70.0, price=130.0),
+    trade("AAPL", (2020, 3, 1), -8, "C", 150.0, price=140.0),
+    # a short open at the year end, covered in 2020
+    trade("TSLA", (2019, 11, 1), -4, "O", price=300.0),
+    trade("TSLA", (2020, 2, 1), 4, "C", 200.0, price=250.0),
+    # opened and closed after the snapshot
+    trade("MSFT", (2020, 4, 1), 3, "O", price=160.0),
+    trade("MSFT", (2020, 5, 1), -3, "C", 30.0, price=170.0),
+]
+
+
+def report(*years):
+    records = {x: [] for x in RECORD_TYPES}
+    records[Trade] = [x for x in TRADES if str(x.datetime.year) in years]
+    return Report(list(years), records)
+
+
+def currencies():
+    days = [date(2019, 1, 1), date(2020, 12, 31)]
+    result = CurrencyMap("RUB")
+    result.add(
+        "USD", RateSeries.from_days([(x.toordinal(), 70.0) for x in days])
+    )
+    return result
+
+
+def rows(found, year):
+    computed = api.compute(found, currencies(), years=[year])
+    return [
+        row
+        for result in computed[year].equities
+        for row in equities.format_rows(result)
+    ]
+
+
+def test_started_from_a_snapshot_is_a_full_recompute(tmp_path):
+    path = tmp_path / "lots-2019.json"
+    snapshot.write(path, snapshot.take(report("2019")))
+    lots = snapshot.read(path)
+
+    started = report("2020").start_from(lots)
+
+    assert lots == snapshot.take(report("2019", "2020"), "2019")
+    assert sorted(lots.lots) == ["AAPL", "TSLA"]
+    found = rows(started, "2020")
+    assert found == rows(report("2019", "2020"), "2020")
+    assert [x[0] for x in found if len(x) > 10] == ["AAPL", "MSFT", "TSLA"]
+    # and the lots at the end of the next year
+    assert snapshot.take(started) == snapshot.take(report("2019", "2020"))
+
+
+def test_verify_reports_a_mismatch():
+    lots = snapshot.take(report("2019"))
+    assert snapshot.verify(lots, report("2019", "2020")) == []
+
+    # a lot of AAPL is lost, the recomputed lots come first
+    lots.lots["AAPL"] = lots.lots["AAPL"][1:]
+
+    assert snapshot.verify(lots, report("2019", "2020")) == [
+        "AAPL: 2 lots of 8 != 1 lots of 5"
+    ]
+
+
+def test_lots_must_be_older_than_the_reports():
+    lots = snapshot.take(report("2019", "2020"))
+
+    with pytest.raises(ValueError, match="not older"):
+        report("2020").start_from(lots)
@@ -0,0 +1,74 @@
+from datetime import date
+
+import pytest
+
+from ibtax.store import RateStore, merge_intervals
+
+
+@pytest.fixture
+def store():
+    store = RateStore(":memory:")
+    yield store
+    store.close()
+
+
+def day(month, number):
+    return date(2020, month, number)
+
+
+def test_merge_intervals():
+    # adjacent and overlapping intervals are one, the others are kept
+    assert merge_intervals([(10, 20), (1, 5), (6, 8), (15, 25), (30, 31)]) == [
+        (1, 8),
+        (10, 25),
+        (30, 31),
+    ]
+
+
+def test_adjacent_and_overlapping_marks_merge(store):
+    store.mark("USD", day(1, 1), day(1, 31))
+    store.mark("USD", day(2, 1), day(2, 10))
+    store.mark("USD", day(2, 5), day(2, 20))
+    store.mark("USD", day(3, 1), day(3, 31))
+    store.mark("EUR", day(1, 1), day(12, 31))
+
+    assert store.intervals("USD") == [
+        (day(1, 1).toordinal(), day(2, 20).toordinal()),
+        (day(3, 1).toordinal(), day(3, 31).toordinal()),
+    ]
+
+
+def test_missing_returns_the_uncovered_ranges(store):
+    store.mark("USD", day(1, 10), day(1, 20))
+    store.mark("USD", day(2, 1), day(2, 10))
+
+    assert store.missing("USD", day(1, 1), day(2, 28)) == [
+        (day(1, 1), day(1, 9)),
+        (day(1, 21), day(1, 31)),
+        (day(2, 11), day(2, 28)),
+    ]
+    assert store.missing("USD", day(1, 12), day(1, 18)) == []
+    assert store.missing("USD", day(1, 15), day(1, 25)) == [
+        (day(1, 21), day(1, 25))
+    ]
+    assert store.missing("EUR", day(1, 1), day(1, 2)) == [
+        (day(1, 1), day(1, 2))
+    ]
+
+
+def test_read_carries_the_rates_to_the_held_end(store):
+    # friday before the range and a tuesday in it, nothing after
+    store.add(
+        "USD",
+        day(1, 1),
+        day(1, 31),
+        [(day(1, 10).toordinal(), 60.0), (day(1, 14).toordinal(), 61.0)],
+    )
+
+    series = store.read("USD", day(1, 12), day(1, 31))
+
+    assert series.get(day(1, 12)) == 60.0
+    assert series.get(day(1, 13)) == 60.0
+    assert series.get(day(1, 14)) == 61.0
+    assert series.get(day(1, 31)) == 61.0
+    assert series.last == day(1, 31)
@@ -0,0 +1,72 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+from ibtax.transport import HttpTransport, TransportError
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # keep-alive is promised, the connection is closed after every response
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.hits += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.hits = 0
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+def test_closed_idle_connection_is_not_a_failure(server):
+    transport = HttpTransport(url(server), timeout=5, retries=0, backoff=10)
+
+    started = time.perf_counter()
+    assert transport.get("/a") == b"ok"
+    # the idle connection is closed by now, retried at once on a new one
+    time.sleep(0.05)
+    assert transport.get("/b") == b"ok"
+    transport.close()
+
+    assert time.perf_counter() - started < 5
+    assert server.hits == 2
+
+
+def test_server_errors_are_retried(server):
+    server.statuses = [503, 503]
+    transport = HttpTransport(url(server), timeout=5, retries=2, backoff=0.01)
+
+    assert transport.get("/a") == b"ok"
+    assert server.hits == 3
+
+
+def test_client_errors_are_not_retried(server):
+    server.statuses = [404]
+    transport = HttpTransport(url(server), timeout=5, retries=2, backoff=0.01)
+
+    with pytest.raises(TransportError, match="HTTP 404"):
+        transport.get("/a")
+    assert server.hits == 1